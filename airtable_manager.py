@@ -8,14 +8,20 @@ import threading
 from urllib.parse import quote
 from pyairtable import Table
 from drive_manager import DriveManager
+from search_index import SearchIndex
+from thumbnail_fetcher import ThumbnailFetcher
 from file_handlers import SimpleHTTPRequestHandlerWithCORS
+from event_log import get_logger
+from profiling import profiled
+
+log = get_logger("AirtableManager")
 
 class AirtableManager:
     """Manages interactions with Airtable for storing TikTok video data."""
     
     def __init__(self):
         """Initialize Airtable connection"""
-        print("\nInitializing AirtableManager...")
+        log.debug("initializing")
         
         # Get environment variables
         self.base_id = os.getenv("AIRTABLE_BASE_ID")
@@ -26,12 +32,12 @@ class AirtableManager:
         self.http_server = None
         self.server_thread = None
         self.drive_manager = DriveManager()
+        self.search_index = SearchIndex.from_env()
+        self.thumbnails = ThumbnailFetcher.from_env()
         self.table = None  # Initialize to None
         
-        print(f"Environment variables loaded:")
-        print(f"Base ID: {self.base_id}")
-        print(f"Token available: {'Yes' if self.token else 'No'}")
-        print(f"Table name: {self.table_name}")
+        log.debug("config_loaded", base_id=self.base_id, token_available=bool(self.token),
+                  table_name=self.table_name)
         
         # Validate environment variables
         if not self.base_id:
@@ -42,18 +48,16 @@ class AirtableManager:
             raise ValueError("Missing AIRTABLE_TABLE_NAME in environment variables")
             
         try:
-            print("Attempting to connect to Airtable...")
             self.table = Table(self.token, self.base_id, self.table_name)
             # Test the connection by trying to get one record
             try:
                 self.table.first()
-                print("Successfully connected to Airtable!")
+                log.info("connected", "Successfully connected to Airtable!")
             except Exception as e:
-                print(f"Failed to verify table connection: {str(e)}")
+                log.error("connection_check_failed", f"Failed to verify table connection: {str(e)}")
                 raise
         except Exception as e:
-            print(f"Error connecting to Airtable: {str(e)}")
-            print(f"Full error details: {repr(e)}")
+            log.error("connection_error", f"Error connecting to Airtable: {str(e)}", error=repr(e))
             raise
 
     def start_temp_server(self, file_path):
@@ -84,14 +88,12 @@ class AirtableManager:
             self.http_server = None
             self.server_thread = None
 
+    @profiled("create_record")
     def create_record(self, video_id, description, uploader, status="Downloaded", video_file=None, source_url=None):
         """Create a record in Airtable for a downloaded video"""
+        vlog = log.bind(video_id=video_id)
         try:
-            print(f"\nCreating Airtable record...")
-            print(f"Video ID: {video_id}")
-            print(f"Uploader: {uploader}")
-            print(f"Description: {description if description else 'No description available'}")
-            print(f"Status: {status}")
+            vlog.debug("record_creating", uploader=uploader, status=status)
             
             from datetime import datetime
             current_time = datetime.now().isoformat()
@@ -109,54 +111,111 @@ class AirtableManager:
             
             # Create the record first (fast operation)
             record = self.table.create(record_data)
-            print("Successfully created base Airtable record")
+            vlog.debug("record_created", record_id=record["id"])
+            self.index_video(video_id, description, uploader, status, source_url, video_file, current_time)
             
             # If we have a video file, upload it to Google Drive and update the record
             if video_file and os.path.exists(video_file):
-                print(f"\nUploading video file: {video_file}")
                 try:
-                    # Upload to Google Drive
-                    shareable_link = self.drive_manager.upload_file(video_file)
+                    # Upload to Google Drive; the record is updated once the link is shared
+                    shareable_link = self.drive_manager.upload_file(
+                        video_file,
+                        uploader=uploader,
+                        on_shared=lambda link: self.attach_video_file(record["id"], link, video_id)
+                    )
                     
-                    if shareable_link:
-                        print(f"File uploaded to Drive: {shareable_link}")
-                        # Update Airtable record with video file
-                        self.table.update(record["id"], {
-                            "Video File": [{"url": shareable_link}]
-                        })
-                        print("Successfully updated record with video file")
-                    else:
-                        print("Failed to upload to Google Drive")
+                    if not shareable_link:
+                        vlog.warning("upload_failed", "Failed to upload to Google Drive", file=video_file)
                 except Exception as e:
-                    print(f"Error during video upload: {str(e)}")
+                    vlog.warning("upload_failed", f"Error during video upload: {str(e)}", file=video_file)
                     # Don't re-raise, let the record creation succeed
             
+            self.attach_thumbnail(record["id"], video_id, video_file, uploader)
             return record
             
         except Exception as e:
-            print(f"Error in create_record: {str(e)}")
-            print(f"Full error details: {repr(e)}")
+            vlog.error("record_error", f"Error in create_record: {str(e)}", error=repr(e))
             return None
 
-    def update_record_with_file(self, record_id, video_file):
+    def index_video(self, video_id, description, uploader, status, source_url, video_file, archived_at):
+        """Add a video to the local search index; indexing problems never fail the record"""
+        if not self.search_index:
+            return
+        try:
+            self.search_index.add_video(video_id, description, uploader, status, source_url,
+                                        video_file, archived_at)
+        except Exception as e:
+            log.warning("index_error", f"Error indexing video: {str(e)}", video_id=video_id)
+
+    def attach_video_file(self, record_id, shareable_link, video_id=None):
+        """Point a record's Video File attachment at a shared Drive link"""
+        try:
+            self.table.update(record_id, {
+                "Video File": [{"url": shareable_link}]
+            })
+            log.debug("record_file_attached", video_id=video_id, record_id=record_id, link=shareable_link)
+            if video_id and self.search_index:
+                self.search_index.set_drive_link(video_id, shareable_link)
+        except Exception as e:
+            log.error("record_error", f"Error attaching video file: {str(e)}", video_id=video_id, record_id=record_id)
+
+    def attach_thumbnail(self, record_id, video_id, video_file=None, uploader=None):
+        """Attach the video's prefetched cover image, uploading it unless an identical one already was"""
+        if not self.thumbnails:
+            return
+        thumbnail_file = self.thumbnails.result(video_id)
+        if not thumbnail_file:
+            return
+        upload_file = thumbnail_file
+        if video_file:
+            try:
+                upload_file = self.thumbnails.place_beside(thumbnail_file, video_file)
+            except OSError as e:
+                log.warning("thumbnail_error", f"Could not save thumbnail next to the video: {str(e)}",
+                            video_id=video_id)
+
+        def attach(link):
+            self.thumbnails.remember_link(thumbnail_file, link)
+            try:
+                self.table.update(record_id, {"Thumbnail": [{"url": link}]})
+                log.debug("record_thumbnail_attached", video_id=video_id, record_id=record_id, link=link)
+            except Exception as e:
+                log.warning("record_error", f"Error attaching thumbnail: {str(e)}", video_id=video_id,
+                            record_id=record_id)
+
+        link = self.thumbnails.drive_link(thumbnail_file)
+        if link:
+            attach(link)
+            return
+        # Same Drive folder as the video, so the flat layout stays flat
+        if not self.drive_manager.upload_file(upload_file, uploader=uploader, on_shared=attach):
+            log.warning("upload_failed", "Failed to upload thumbnail to Google Drive", video_id=video_id,
+                        file=upload_file)
+
+    def update_record_with_file(self, record_id, video_file, uploader=None):
         """Update an existing record with a video file"""
         try:
-            print(f"\nUpdating record with video file...")
             # Upload to Google Drive first
-            print("Uploading to Google Drive...")
-            shareable_link = self.drive_manager.upload_file(video_file)
+            shareable_link = self.drive_manager.upload_file(
+                video_file,
+                uploader=uploader,
+                on_shared=lambda link: self.attach_video_file(record_id, link)
+            )
             
             if shareable_link:
-                print(f"File uploaded to Drive: {shareable_link}")
-                self.table.update(record_id, {
-                    "Video File": [{"url": shareable_link}]
-                })
-                print("Successfully updated record with video file")
                 return True
             else:
-                print("Failed to upload to Google Drive")
+                log.warning("upload_failed", "Failed to upload to Google Drive", record_id=record_id, file=video_file)
                 return False
             
         except Exception as e:
-            print(f"Error updating record with video file: {str(e)}")
+            log.error("record_error", f"Error updating record with video file: {str(e)}", record_id=record_id)
             return False
+
+    def close(self):
+        """Send any Drive permission grants still waiting for a batch"""
+        if self.thumbnails:
+            self.thumbnails.close()
+        self.drive_manager.flush_permissions()
+        if self.search_index:
+            self.search_index.close()
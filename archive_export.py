@@ -0,0 +1,385 @@
+"""
+Streaming export of the archive into portable, indexed tar+zstd bundles.
+
+Every archived video in the search index (see search_index.py) is written as
+a directory entry holding metadata.json and the video file. Local copies are
+read from disk and videos only held in Drive are streamed from it; nothing is
+staged in a temp file. Each video is its own zstd frame, so a bundle is at the
+same time a valid .tar.zst (`zstd -dc export-0001.tar.zst | tar x`) and, via
+manifest.jsonl, a random-access archive:
+
+    python archive_export.py export exports/              # resumes if interrupted
+    python archive_export.py extract exports/ 7212345678901234567 --dest .
+    python archive_export.py list exports/
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+
+# Keep stdout clean for the JSON stats of `export`
+os.environ.setdefault("LOG_CONSOLE_STREAM", "stderr")
+
+import zstandard
+from dotenv import load_dotenv
+from googleapiclient.http import MediaIoBaseDownload
+
+import bandwidth
+from drive_manager import DriveManager
+from event_log import get_logger
+from search_index import SearchIndex
+
+log = get_logger("ArchiveExport")
+
+MANIFEST_NAME = "manifest.jsonl"
+BLOCK_SIZE = tarfile.BLOCKSIZE
+READ_CHUNK_SIZE = 1024 * 1024
+DRIVE_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def bundle_name(number):
+    """File name of the numbered bundle."""
+    return f"export-{number:04d}.tar.zst"
+
+
+def drive_file_id(link):
+    """Return the file ID from a https://drive.google.com/uc?id=... link, or None."""
+    if link and "id=" in link:
+        return link.split("id=", 1)[1].split("&")[0]
+    return None
+
+
+class _FrameSink:
+    """File-like target that counts, hashes and compresses what the video source writes."""
+
+    def __init__(self, write):
+        self._write = write
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self._write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+        return len(data)
+
+
+class BundleWriter:
+    """Appends one zstd frame per video to numbered bundles and records them in the manifest."""
+
+    def __init__(self, directory, bundle_size=2 * 1024 ** 3, level=3, threads=0):
+        """Open the export directory, resuming after the last complete entry."""
+        self.directory = directory
+        self.bundle_size = bundle_size
+        self.compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+
+        self.exported = set()
+        self.bundle_number = 1
+        end = 0
+        for entry in read_manifest(directory):
+            self.exported.add(entry["video_id"])
+            if entry["bundle_number"] >= self.bundle_number:
+                self.bundle_number = entry["bundle_number"]
+                end = entry["offset"] + entry["length"]
+        self.file = None
+        self.frame_bytes = 0
+        self._open_bundle(end)
+        self._trim_manifest()
+        self.manifest = open(self.manifest_path, "a", encoding="utf-8")
+        self.stats = {"videos": 0, "bytes_in": 0, "bytes_out": 0, "failed": 0, "skipped": len(self.exported)}
+
+    def _open_bundle(self, end=0):
+        """Open the current bundle and cut anything after the last complete entry."""
+        path = os.path.join(self.directory, bundle_name(self.bundle_number))
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        # An interrupted run can leave a partial frame or an end-of-archive marker behind
+        self.file.truncate(end)
+        self.file.seek(end)
+        self.writer = self.compressor.stream_writer(self.file, closefd=False)
+
+    def _trim_manifest(self):
+        """Drop a partial last manifest line so the next entry starts on its own line."""
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, "r+b") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _finish_bundle(self):
+        """End the current bundle with the tar end-of-archive marker."""
+        self.writer.write(b"\0" * BLOCK_SIZE * 2)
+        self.writer.flush(zstandard.FLUSH_FRAME)
+        self.file.close()
+
+    def add(self, video_id, metadata, file_name, size, copy_to):
+        """Write one video as its own frame; copy_to(sink) must write exactly size bytes.
+
+        On any error the frame is cut off again, so the bundle stays valid.
+        """
+        if self.file.tell() >= self.bundle_size:
+            self._finish_bundle()
+            self.bundle_number += 1
+            self._open_bundle()
+
+        offset = self.file.tell()
+        self.frame_bytes = 0
+        meta_bytes = json.dumps(metadata, ensure_ascii=False, indent=2).encode("utf-8")
+        try:
+            self._write_member(f"{video_id}/metadata.json", meta_bytes)
+            self._write(self._header(f"{video_id}/{file_name}", size))
+            sink = _FrameSink(self._write)
+            copy_to(sink)
+            if sink.size != size:
+                raise ValueError(f"expected {size} bytes, got {sink.size}")
+            self._write(self._padding(size))
+            self.writer.flush(zstandard.FLUSH_FRAME)
+            self.file.flush()
+        except Exception:
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            self.writer = self.compressor.stream_writer(self.file, closefd=False)
+            raise
+
+        length = self.file.tell() - offset
+        tar_size = self.frame_bytes
+        entry = {
+            "video_id": video_id,
+            "bundle": bundle_name(self.bundle_number),
+            "bundle_number": self.bundle_number,
+            "offset": offset,
+            "length": length,
+            "member": f"{video_id}/{file_name}",
+            "size": size,
+            "tar_size": tar_size,
+            "sha256": sink.sha256.hexdigest(),
+        }
+        # The manifest line is the commit point; a crash before it just rewrites this video
+        self.manifest.write(json.dumps(entry) + "\n")
+        self.manifest.flush()
+        self.exported.add(video_id)
+        self.stats["videos"] += 1
+        self.stats["bytes_in"] += tar_size
+        self.stats["bytes_out"] += length
+        return entry
+
+    def close(self):
+        """Finish the current bundle and the manifest."""
+        self._finish_bundle()
+        self.manifest.close()
+
+    def _write(self, data):
+        """Compress data into the current frame, counting the uncompressed bytes."""
+        self.writer.write(data)
+        self.frame_bytes += len(data)
+
+    def _write_member(self, name, data):
+        """Write a small in-memory tar member."""
+        self._write(self._header(name, len(data)))
+        self._write(data)
+        self._write(self._padding(len(data)))
+
+    def _header(self, name, size):
+        """Tar header block(s) for a regular file."""
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        return info.tobuf(format=tarfile.PAX_FORMAT)
+
+    def _padding(self, size):
+        """Zero bytes that pad a member's data to a whole tar block."""
+        return b"\0" * (-size % BLOCK_SIZE)
+
+
+def read_manifest(directory):
+    """Yield manifest entries, ignoring a partial last line."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def extract(directory, video_id, dest):
+    """Extract one video and its metadata by seeking straight to its frame; returns the paths."""
+    entry = None
+    for candidate in read_manifest(directory):
+        if candidate["video_id"] == video_id:
+            entry = candidate
+    if entry is None:
+        raise KeyError(f"{video_id} is not in the manifest")
+
+    paths = []
+    with open(os.path.join(directory, entry["bundle"]), "rb") as f:
+        f.seek(entry["offset"])
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BufferedReader(_Window(f, entry["length"])))
+        with tarfile.open(fileobj=reader, mode="r|") as tar:
+            for member in tar:
+                target = os.path.join(dest, member.name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as source, open(target, "wb") as out:
+                    while chunk := source.read(READ_CHUNK_SIZE):
+                        out.write(chunk)
+                paths.append(target)
+    return paths
+
+
+class _Window(io.RawIOBase):
+    """Read-only view of length bytes from the current position of a file."""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.f.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+class ArchiveExporter:
+    """Feeds archived videos from the search index into a BundleWriter."""
+
+    def __init__(self, bundle_writer, search_index):
+        self.bundles = bundle_writer
+        self.search_index = search_index
+        self.drive_manager = None  # Only signed in to when a video is not on disk
+        self.download_limiter = bandwidth.download_limiter()
+
+    def videos(self):
+        """Archived videos from the index, oldest first."""
+        with self.search_index.lock:
+            rows = self.search_index.conn.execute(
+                "SELECT * FROM videos WHERE status = 'Downloaded' ORDER BY archived_at, video_id"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def export(self, limit=None):
+        """Export every video not yet in the manifest; returns the writer's stats."""
+        start_time = time.time()
+        for video in self.videos():
+            if limit is not None and self.bundles.stats["videos"] >= limit:
+                break
+            video_id = video["video_id"]
+            if video_id in self.bundles.exported:
+                continue
+            try:
+                self.export_video(video)
+            except Exception as e:
+                # Covers videos with nothing to read as well as ones that failed inside the bundle
+                self.bundles.stats["failed"] += 1
+                log.warning("export_failed", f"Could not export {video_id}: {str(e)}", video_id=video_id)
+        self.bundles.close()
+
+        stats = dict(self.bundles.stats)
+        elapsed = max(time.time() - start_time, 0.001)
+        stats["seconds"] = round(elapsed, 1)
+        stats["bytes_per_second"] = round(stats["bytes_in"] / elapsed)
+        stats["compression_ratio"] = round(stats["bytes_in"] / stats["bytes_out"], 3) if stats["bytes_out"] else None
+        log.info("export_finished",
+                 f"Exported {stats['videos']} videos ({stats['bytes_in'] / 1024 / 1024:.1f} MB) in {elapsed:.1f}s, "
+                 f"{stats['bytes_per_second'] / 1024 / 1024:.1f} MB/s, compression ratio "
+                 f"{stats['compression_ratio'] or 0:.3f}; {stats['skipped']} already exported, {stats['failed']} failed",
+                 **stats)
+        return stats
+
+    def export_video(self, video):
+        """Stream one video from disk or Drive into the bundle."""
+        video_file = video.get("video_file")
+        metadata = {key: value for key, value in video.items() if value is not None}
+        if video_file and os.path.exists(video_file):
+            def copy_local(sink):
+                with open(video_file, "rb") as f:
+                    while chunk := f.read(READ_CHUNK_SIZE):
+                        sink.write(chunk)
+            return self.bundles.add(video["video_id"], metadata, os.path.basename(video_file),
+                                    os.path.getsize(video_file), copy_local)
+
+        file_id = drive_file_id(video.get("drive_link"))
+        if not file_id:
+            raise FileNotFoundError("no local file and no Drive link")
+        service = self.drive().service
+        info = service.files().get(fileId=file_id, fields="name,size").execute()
+
+        def copy_from_drive(sink):
+            downloader = MediaIoBaseDownload(sink, service.files().get_media(fileId=file_id),
+                                             chunksize=DRIVE_CHUNK_SIZE)
+            done = False
+            while not done:
+                if self.download_limiter:
+                    self.download_limiter.consume(DRIVE_CHUNK_SIZE)
+                _, done = downloader.next_chunk()
+        return self.bundles.add(video["video_id"], metadata, info["name"], int(info["size"]), copy_from_drive)
+
+    def drive(self):
+        """Drive connection, created on first use."""
+        if self.drive_manager is None:
+            self.drive_manager = DriveManager()
+        return self.drive_manager
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Export the archive to indexed tar+zstd bundles")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export (or resume exporting) every archived video")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--index", help="Search index path (default: SEARCH_INDEX_PATH or archive_index.sqlite3)")
+    export_parser.add_argument("--bundle-size-mb", type=int, default=2048, help="Start a new bundle after this size")
+    export_parser.add_argument("--level", type=int, default=3, help="zstd compression level")
+    export_parser.add_argument("--threads", type=int, default=0, help="zstd worker threads (0: none, -1: one per CPU)")
+    export_parser.add_argument("--limit", type=int, help="Stop after this many videos")
+
+    extract_parser = subparsers.add_parser("extract", help="Extract one video without unpacking the bundle")
+    extract_parser.add_argument("directory")
+    extract_parser.add_argument("video_id")
+    extract_parser.add_argument("--dest", default=".")
+
+    list_parser = subparsers.add_parser("list", help="List exported videos")
+    list_parser.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "extract":
+        for path in extract(args.directory, args.video_id, args.dest):
+            print(path)
+        return 0
+
+    if args.command == "list":
+        for entry in read_manifest(args.directory):
+            print(f"{entry['video_id']}\t{entry['bundle']}\t{entry['offset']}\t{entry['size']}\t{entry['member']}")
+        return 0
+
+    load_dotenv()
+    search_index = SearchIndex(args.index) if args.index else SearchIndex.from_env()
+    if search_index is None:
+        print("The search index is disabled (SEARCH_INDEX_PATH is empty)", file=sys.stderr)
+        return 1
+    writer = BundleWriter(args.directory, bundle_size=args.bundle_size_mb * 1024 * 1024,
+                          level=args.level, threads=args.threads)
+    stats = ArchiveExporter(writer, search_index).export(limit=args.limit)
+    print(json.dumps(stats, indent=2))
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
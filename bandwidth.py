@@ -0,0 +1,236 @@
+"""
+Token-bucket bandwidth shaping for video downloads and Drive uploads.
+
+One limiter per direction is shared by every worker. Limits follow a
+time-of-day schedule, e.g. DOWNLOAD_RATE_LIMIT="mon-fri@09:00-18:00=2MB;*=off"
+caps downloads at 2 MB/s during working hours and leaves them uncapped
+otherwise. Entries are checked in order and the first match wins.
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from event_log import get_logger
+
+log = get_logger("Bandwidth")
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2, "g": 1024 ** 3, "gb": 1024 ** 3}
+UNLIMITED = ("", "0", "off", "none", "unlimited")
+
+RATE_PATTERN = re.compile(r"^([\d.]+)\s*([kmg]?b?)(/s)?$")
+WINDOW_PATTERN = re.compile(r"^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$")
+
+
+def parse_rate(text):
+    """Parse '2MB', '500k' or '1.5MB/s' into bytes per second; None means uncapped."""
+    text = text.strip().lower()
+    if text in UNLIMITED:
+        return None
+    match = RATE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r}")
+    return float(match.group(1)) * UNITS[match.group(2)]
+
+
+def parse_days(text):
+    """Parse 'mon-fri' or 'sat+sun' into a set of weekday numbers (Monday is 0)."""
+    days = set()
+    for part in text.lower().split("+"):
+        first, _, last = part.partition("-")
+        start = DAYS.index(first)
+        end = DAYS.index(last) if last else start
+        # Ranges may wrap past Sunday, e.g. 'fri-mon'
+        days.update((start + offset) % 7 for offset in range((end - start) % 7 + 1))
+    return days
+
+
+class RateSchedule:
+    """Time-of-day rate limits: a list of (days, start_minute, end_minute, rate) entries."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @classmethod
+    def parse(cls, text):
+        """Parse 'days@HH:MM-HH:MM=RATE;...;*=RATE'. A bare rate applies all day."""
+        entries = []
+        for item in re.split(r"[;,]", text or ""):
+            item = item.strip()
+            if not item:
+                continue
+            spec, _, rate = item.rpartition("=")
+            spec = spec.strip() or "*"
+            days, _, window = spec.rpartition("@")
+            if not days and window and window[0].isalpha() and window != "*":
+                days, window = window, "*"  # Days only, e.g. 'sat+sun=off'
+            start, end = 0, 24 * 60
+            if window != "*":
+                match = WINDOW_PATTERN.match(window)
+                if not match:
+                    raise ValueError(f"Invalid time window: {window!r}")
+                hour1, minute1, hour2, minute2 = (int(group) for group in match.groups())
+                start, end = hour1 * 60 + minute1, hour2 * 60 + minute2
+            entries.append((parse_days(days) if days else None, start, end, parse_rate(rate)))
+        return cls(entries)
+
+    def rate_at(self, moment=None):
+        """Return the limit in bytes/second at the given time, or None if uncapped."""
+        moment = moment or datetime.now()
+        minute = moment.hour * 60 + moment.minute
+        for days, start, end, rate in self.entries:
+            if days is not None and moment.weekday() not in days:
+                continue
+            # A window such as 22:00-06:00 wraps past midnight
+            in_window = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if in_window:
+                return rate
+        return None
+
+
+class TokenBucket:
+    """Rate limiter shared by all threads transferring in one direction.
+
+    The bucket is kept as the time at which it will next be full again
+    (a virtual schedule), so a transfer that was already paced while it ran,
+    such as a throttled browser download, is charged only for the time it
+    finished early. Up to burst_seconds worth of bytes may go out at once.
+    """
+
+    def __init__(self, name, schedule, burst_seconds=2.0, report_interval=60.0):
+        self.name = name
+        self.schedule = schedule
+        self.burst_seconds = burst_seconds
+        self.report_interval = report_interval
+        self.next_free = 0.0
+        self.lock = threading.Lock()
+
+        self.total_bytes = 0
+        self.waited_seconds = 0.0
+        self.first_transfer = None
+        self.last_transfer = None
+        self.window_start = time.time()
+        self.window_bytes = 0
+
+    @classmethod
+    def from_env(cls, name, variable):
+        """Build a limiter from a schedule variable; None when it is unset or empty."""
+        text = os.getenv(variable, "").strip()
+        if not text:
+            return None
+        schedule = RateSchedule.parse(text)
+        return cls(name, schedule,
+                   burst_seconds=float(os.getenv("BANDWIDTH_BURST_SECONDS", "2")),
+                   report_interval=float(os.getenv("BANDWIDTH_REPORT_INTERVAL", "60")))
+
+    def current_rate(self):
+        """Return the limit in effect right now, in bytes/second, or None."""
+        return self.schedule.rate_at()
+
+    def consume(self, size):
+        """Block until size bytes may be sent, then charge them. Used before each upload chunk."""
+        start = self._reserve(size, time.time())
+        self.wait(until=start)
+
+    def record(self, size, started):
+        """Charge size bytes that were transferred since started. Never blocks."""
+        self._reserve(size, started)
+
+    def wait(self, until=None):
+        """Block until the bucket has room for the next transfer to start."""
+        start_time = time.time()
+        while True:
+            rate = self.current_rate()
+            with self.lock:
+                if rate is None:
+                    # Uncapped now; forget debt built up under an earlier limit
+                    self.next_free = min(self.next_free, time.time())
+                    break
+                ready = (self.next_free if until is None else until) - self.burst_seconds
+            delay = ready - time.time()
+            if delay <= 0:
+                break
+            # Re-check at least every second so a schedule change takes effect promptly
+            time.sleep(min(delay, 1.0))
+        waited = time.time() - start_time
+        if waited > 0.01:
+            with self.lock:
+                self.waited_seconds += waited
+
+    def _reserve(self, size, started):
+        """Advance the virtual schedule by size bytes from started; return the slot start."""
+        rate = self.current_rate()
+        now = time.time()
+        with self.lock:
+            slot_start = max(self.next_free, started)
+            if rate:
+                self.next_free = slot_start + size / rate
+            self.total_bytes += size
+            self.window_bytes += size
+            if self.first_transfer is None:
+                self.first_transfer = started
+            self.last_transfer = now
+            report = now - self.window_start >= self.report_interval
+            if report:
+                window_rate = self.window_bytes / (now - self.window_start)
+                self.window_start, self.window_bytes = now, 0
+        if report:
+            log.debug("bandwidth_rate", direction=self.name, bytes_per_second=round(window_rate),
+                      limit=rate)
+        return slot_start
+
+    def summary(self):
+        """Return totals and the achieved average rate."""
+        with self.lock:
+            # Paced transfers are not finished until the schedule catches up with them
+            end = max(self.last_transfer, min(self.next_free, time.time())) if self.first_transfer else 0.0
+            active = (end - self.first_transfer) if self.first_transfer else 0.0
+            return {
+                "bytes": self.total_bytes,
+                "seconds": round(active, 1),
+                "bytes_per_second": round(self.total_bytes / active) if active > 0 else None,
+                "waited_seconds": round(self.waited_seconds, 1),
+                "limit_now": self.current_rate(),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter(name, variable):
+    """Return the process-wide limiter for a direction, creating it on first use."""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = TokenBucket.from_env(name, variable)
+        return _limiters[name]
+
+
+def download_limiter():
+    """Limiter for browser downloads (DOWNLOAD_RATE_LIMIT), or None."""
+    return _limiter("download", "DOWNLOAD_RATE_LIMIT")
+
+
+def upload_limiter():
+    """Limiter for Drive uploads (UPLOAD_RATE_LIMIT), or None."""
+    return _limiter("upload", "UPLOAD_RATE_LIMIT")
+
+
+def report():
+    """Log the achieved rate of every limiter in use and return them by direction."""
+    with _limiters_lock:
+        limiters = [limiter for limiter in _limiters.values() if limiter]
+    result = {}
+    for limiter in limiters:
+        stats = limiter.summary()
+        result[limiter.name] = stats
+        rate = stats["bytes_per_second"]
+        log.info("bandwidth_summary",
+                 f"{limiter.name.capitalize()}s: {stats['bytes'] / 1024 / 1024:.1f} MB"
+                 + (f" at {rate / 1024 / 1024:.2f} MB/s" if rate else "")
+                 + f", {stats['waited_seconds']:.0f}s spent waiting for the rate limit",
+                 direction=limiter.name, **stats)
+    return result
@@ -0,0 +1,153 @@
+"""
+Non-interactive batch entry point for the TikTok video downloader.
+
+Reads video URLs or IDs (one per line) from a file or stdin as a stream and
+pushes each through the same download, upload and record stages as the
+interactive mode. Progress goes to stderr; a JSON summary is printed to
+stdout when the run ends. Example cron usage:
+
+    python batch_cli.py urls.txt > summary.json
+    cat urls.txt | python batch_cli.py -
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Keep stdout clean for the machine-readable summary
+os.environ.setdefault("LOG_CONSOLE_STREAM", "stderr")
+
+import bandwidth
+import event_log
+import profiling
+from airtable_manager import AirtableManager
+from browser_manager import BrowserManager
+from browser_supervisor import BrowserSupervisor
+from tiktok_scraper import TikTokScraper
+
+log = event_log.get_logger("BatchCLI")
+
+VIDEO_URL_TEMPLATE = "https://www.tiktok.com/@/video/{video_id}"
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_SETUP_ERROR = 2
+
+
+def iter_inputs(stream):
+    """Yield (line, url) for each non-empty, non-comment line as it arrives."""
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.isdigit():
+            yield line, VIDEO_URL_TEMPLATE.format(video_id=line)
+        elif "/video/" in line:
+            yield line, line
+        else:
+            yield line, None
+
+
+def new_summary():
+    """Return an empty run summary."""
+    return {"total": 0, "archived": 0, "failed": 0, "invalid": 0,
+            "failed_items": [], "invalid_items": []}
+
+
+def run(stream, profile_name, headless, summary):
+    """Process every input, filling in summary as it goes."""
+    start_time = time.time()
+    airtable = None
+    browser = None
+    supervisor = None
+    try:
+        airtable = AirtableManager()
+        browser = BrowserManager(profile_name, headless=headless)
+        scraper = TikTokScraper(browser.driver, airtable)
+        # Nobody is watching the window, so a Chrome exit is always a crash
+        supervisor = BrowserSupervisor.from_env(browser, scraper, restart_on_exit=True)
+        if supervisor:
+            scraper.supervisor = supervisor
+            supervisor.start()
+
+        for line, url in iter_inputs(stream):
+            summary["total"] += 1
+            if not url:
+                log.warning("invalid_input", f"Not a TikTok video URL or ID: {line}")
+                summary["invalid"] += 1
+                summary["invalid_items"].append(line)
+                continue
+            log.debug("video_queued", url=url, video_id=scraper.extract_video_id(url))
+            generation = scraper.generation
+            archived = scraper.download_video(url)
+            if not archived and scraper.generation != generation:
+                # The browser was restarted mid-download; retry once on the new driver
+                archived = scraper.download_video(url)
+            profiling.video_done()
+            if archived:
+                summary["archived"] += 1
+            else:
+                summary["failed"] += 1
+                summary["failed_items"].append(line)
+    finally:
+        if supervisor:
+            supervisor.stop()
+            summary["browser_restarts"] = supervisor.stats["restarts"]
+        if airtable:
+            airtable.close()
+        if browser:
+            browser.cleanup()
+        summary["bandwidth"] = bandwidth.report()
+        summary["duration_seconds"] = round(time.time() - start_time, 1)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Archive TikTok videos listed in a file or stdin")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="File with one video URL or ID per line, or - for stdin (default)")
+    parser.add_argument("--profile", help="Chrome profile directory (default: CHROME_PROFILE from .env)")
+    parser.add_argument("--no-headless", dest="headless", action="store_false",
+                        help="Show the browser window")
+    parser.add_argument("--profile-dir", help="Write per-stage CPU and memory profiles here (sets PROFILE_DIR)")
+    args = parser.parse_args(argv)
+
+    event_log.start_run()
+    load_dotenv()
+    if args.profile_dir:
+        os.environ["PROFILE_DIR"] = args.profile_dir
+    profile_name = args.profile or os.getenv("CHROME_PROFILE")
+
+    summary = new_summary()
+    exit_code = EXIT_OK
+    try:
+        # Third-party setup output must not end up in the JSON on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.input == "-":
+                run(sys.stdin, profile_name, args.headless, summary)
+            else:
+                with open(args.input, "r", encoding="utf-8") as f:
+                    run(f, profile_name, args.headless, summary)
+        if summary["failed"] or summary["invalid"]:
+            exit_code = EXIT_FAILURES
+    except KeyboardInterrupt:
+        log.warning("interrupted", "Interrupted")
+        exit_code = EXIT_FAILURES
+    except Exception as e:
+        log.error("setup_error", f"Batch run failed: {str(e)}")
+        summary["error"] = str(e)
+        exit_code = EXIT_SETUP_ERROR
+    finally:
+        profiling.shutdown()
+        event_log.shutdown()
+
+    print(json.dumps({**summary, "exit_code": exit_code}, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,61 +16,110 @@ import sys
 import setup_chromedriver
 from pyairtable import Table
 import threading
+from event_log import get_logger
+from profile_clone import ProfileClone
+
+log = get_logger("BrowserManager")
 
 class BrowserManager:
     """Manages Chrome browser setup and configuration."""
-    
-    def __init__(self, profile_name=None):
+
+    def __init__(self, profile_name=None, headless=False):
         """Initialize browser manager with optional profile name."""
         self.profile_name = profile_name
+        self.headless = headless
         self.driver = None
         self.download_dir = os.getenv("DOWNLOAD_DIR")
-        print(f"Using download directory: {self.download_dir}")
+        # clone: launch from a RAM-backed copy of the profile; live: use the profile in place
+        self.profile_mode = os.getenv("CHROME_PROFILE_MODE", "clone").lower()
+        self.profile_clone = None
+        log.info("browser_config", f"Using download directory: {self.download_dir}",
+                 download_dir=self.download_dir, profile_mode=self.profile_mode)
         self.setup_driver()
-        
+
     def setup_driver(self):
         """Setup Chrome driver with the specified profile."""
-        print("\nSetting up Chrome driver...")
-        
+        log.debug("driver_setup")
+
         try:
-            # Get Chrome path
+            # Get Chrome and chromedriver paths
             chrome_path = setup_chromedriver.get_chrome_path()
-            print(f"Using Chrome from: {chrome_path}")
-            
+            driver_path = setup_chromedriver.get_chromedriver_path()
+            log.info("chrome_found", f"Using Chrome from: {chrome_path}", chrome_path=chrome_path,
+                     driver_path=driver_path)
+
             # Get user data directory
-            user_data_dir = setup_chromedriver.get_user_data_dir()
-            print(f"Using Chrome profile from: {user_data_dir}")
-            
+            user_data_dir = self.prepare_user_data_dir(setup_chromedriver.get_user_data_dir(chrome_path))
+
             # Setup Chrome options
             options = uc.ChromeOptions()
             options.add_argument(f"--user-data-dir={user_data_dir}")
             if self.profile_name:
                 options.add_argument(f"--profile-directory={self.profile_name}")
-                print(f"Using profile: {self.profile_name}")
-            
-            print("Creating Chrome instance...")
-            self.driver = uc.Chrome(options=options)
-            print("Chrome driver setup successful!")
-            
+            if self.headless:
+                options.add_argument("--window-size=1280,900")
+            if os.getenv("DOWNLOAD_SCHEDULE_POLICY", "fifo").lower() == "shortest":
+                # Lets the scraper read video lengths from the favorites API responses
+                options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+            start_time = time.time()
+            chrome_kwargs = {"options": options, "headless": self.headless, "browser_executable_path": chrome_path}
+            if driver_path:
+                chrome_kwargs["driver_executable_path"] = driver_path
+            self.driver = uc.Chrome(**chrome_kwargs)
+            if self.download_dir:
+                # Headless Chrome does not download unless told where to put files
+                self.driver.execute_cdp_cmd("Browser.setDownloadBehavior", {
+                    "behavior": "allow",
+                    "downloadPath": os.path.abspath(self.download_dir),
+                })
+            launch_seconds = time.time() - start_time
+            log.info("chrome_launched", f"Chrome started in {launch_seconds:.2f}s",
+                     seconds=round(launch_seconds, 3), headless=self.headless,
+                     profile=self.profile_name, user_data_dir=user_data_dir,
+                     clone_seconds=round(self.profile_clone.clone_seconds, 3) if self.profile_clone else None)
+
             return self.driver
-            
+
         except Exception as e:
-            print(f"\nError setting up Chrome driver: {str(e)}")
-            print("\nPlease make sure:")
-            print("1. Close ALL Chrome windows before running this script")
-            print("2. Your antivirus is not blocking ChromeDriver")
-            print("3. You have a stable internet connection")
-            print("4. Chrome is installed in the default location")
+            log.error("driver_setup_error", f"Error setting up Chrome driver: {str(e)}")
+            log.error("driver_setup_help",
+                      "Please make sure: 1. Chrome is installed (or CHROME_PATH is set), "
+                      "2. your antivirus is not blocking ChromeDriver, "
+                      "3. you have a stable internet connection, "
+                      "4. with CHROME_PROFILE_MODE=live, all Chrome windows are closed")
             if self.driver:
                 self.driver.quit()
             raise
-    
+
+    def prepare_user_data_dir(self, source_user_data_dir):
+        """Return the user data directory to launch with, cloning the profile if configured."""
+        if self.profile_mode != "clone":
+            return source_user_data_dir
+        # Reuse the clone across driver restarts so session changes carry over
+        if self.profile_clone and self.profile_clone.user_data_dir:
+            return self.profile_clone.user_data_dir
+        try:
+            self.profile_clone = ProfileClone.from_env(source_user_data_dir, self.profile_name)
+            return self.profile_clone.create()
+        except Exception as e:
+            log.warning("profile_clone_failed", f"Could not clone profile, using it in place: {str(e)}")
+            self.profile_clone = None
+            return source_user_data_dir
+
     def close(self):
         """Close the browser and clean up."""
         if self.driver:
             try:
                 self.driver.quit()
             except Exception as e:
-                print(f"Error closing driver: {str(e)}")
+                log.warning("driver_close_error", f"Error closing driver: {str(e)}")
             finally:
                 self.driver = None
+
+    def cleanup(self):
+        """Close the browser and delete any cloned profile."""
+        self.close()
+        if self.profile_clone:
+            self.profile_clone.remove()
+            self.profile_clone = None
@@ -0,0 +1,225 @@
+"""
+Supervises the Chrome instance during long sessions.
+
+Tracks the memory and open handles of Chrome's process tree, closes stray
+tabs, and restarts the driver when memory passes a watermark or WebDriver
+stops responding. After a restart the scraper restores the favorites page;
+queued downloads live in Python and survive the restart.
+"""
+
+import os
+import threading
+import time
+
+import psutil
+
+from event_log import get_logger
+
+log = get_logger("BrowserSupervisor")
+
+
+class BrowserSupervisor:
+    """Watches Chrome's health and recycles the driver when needed."""
+
+    def __init__(self, browser_manager, scraper, rss_watermark_mb=2048, check_interval=30,
+                 response_timeout=20, restart_on_exit=False, poll_interval=1, busy_timeout=300):
+        """Initialize supervisor for a BrowserManager and the TikTokScraper using its driver."""
+        self.browser_manager = browser_manager
+        self.scraper = scraper
+        self.rss_watermark = rss_watermark_mb * 1024 * 1024
+        self.check_interval = check_interval
+        self.response_timeout = response_timeout
+        self.restart_on_exit = restart_on_exit
+        self.poll_interval = poll_interval
+        self.busy_timeout = busy_timeout
+        self.busy_since = None  # When the driver lock was first seen held by a worker
+
+        self.closed = threading.Event()  # Set when the browser is gone for good
+        self.stopping = threading.Event()
+        self.thread = None
+        self.stats = {"restarts": 0, "tabs_closed": 0, "peak_rss_mb": 0}
+
+    @classmethod
+    def from_env(cls, browser_manager, scraper, restart_on_exit=False):
+        """Build a supervisor from BROWSER_* environment variables, or None if disabled."""
+        if os.getenv("BROWSER_SUPERVISOR", "1") == "0":
+            return None
+        return cls(
+            browser_manager,
+            scraper,
+            rss_watermark_mb=int(os.getenv("BROWSER_RSS_WATERMARK_MB", "2048")),
+            check_interval=float(os.getenv("BROWSER_CHECK_INTERVAL", "30")),
+            response_timeout=float(os.getenv("BROWSER_RESPONSE_TIMEOUT", "20")),
+            busy_timeout=float(os.getenv("BROWSER_BUSY_TIMEOUT", "300")),
+            restart_on_exit=os.getenv("BROWSER_RESTART_ON_EXIT", "1" if restart_on_exit else "0") == "1",
+        )
+
+    def start(self):
+        """Start the supervisor thread."""
+        self.thread = threading.Thread(target=self.run, name="browser-supervisor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop supervising without touching the browser."""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        """Supervisor loop: cheap liveness check every poll, full check every interval."""
+        last_check = time.time()
+        while not self.stopping.wait(self.poll_interval):
+            try:
+                if not self.chrome_running():
+                    if self.restart_on_exit:
+                        self.restart("Chrome exited", kill=True)
+                        continue
+                    self.closed.set()
+                    return
+
+                if time.time() - last_check < self.check_interval:
+                    continue
+                last_check = time.time()
+
+                if not self.responsive():
+                    self.restart("WebDriver not responding", kill=True)
+                    continue
+
+                rss, handles = self.process_tree_usage()
+                rss_mb = rss // (1024 * 1024)
+                self.stats["peak_rss_mb"] = max(self.stats["peak_rss_mb"], rss_mb)
+                log.debug("browser_health", rss_mb=rss_mb, os_handles=handles)
+                if rss > self.rss_watermark:
+                    self.restart(f"Chrome memory {rss_mb} MB over {self.rss_watermark // (1024 * 1024)} MB watermark")
+                    continue
+
+                self.close_stray_tabs()
+
+            except Exception as e:
+                log.error("supervisor_error", f"Error supervising browser: {str(e)}")
+
+    def chrome_processes(self):
+        """Return the live processes in Chrome's process tree, root first."""
+        driver = self.scraper.driver
+        pid = getattr(driver, "browser_pid", None)
+        try:
+            if pid:
+                root = psutil.Process(pid)
+                return [root] + root.children(recursive=True)
+            # Fall back to everything spawned by chromedriver
+            service_process = getattr(getattr(driver, "service", None), "process", None)
+            if service_process:
+                return psutil.Process(service_process.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            pass
+        return []
+
+    def chrome_running(self):
+        """True if Chrome's main process is still alive."""
+        processes = self.chrome_processes()
+        return bool(processes) and processes[0].is_running() and processes[0].status() != psutil.STATUS_ZOMBIE
+
+    def process_tree_usage(self):
+        """Return (total RSS bytes, total OS handles) across Chrome's process tree."""
+        rss = 0
+        handles = 0
+        for process in self.chrome_processes():
+            try:
+                rss += process.memory_info().rss
+                handles += process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return rss, handles
+
+    def responsive(self):
+        """True if a trivial WebDriver call returns within response_timeout.
+
+        ChromeDriver runs one command at a time, so while a worker holds the
+        driver lock (e.g. a slow, throttled page load) the probe is skipped;
+        the driver only counts as hung once the lock has been held for
+        busy_timeout seconds.
+        """
+        lock = self.scraper.driver_lock
+        if not lock.acquire(timeout=1):
+            now = time.time()
+            self.busy_since = self.busy_since or now
+            if now - self.busy_since < self.busy_timeout:
+                return True
+            log.warning("driver_busy", f"Driver lock held for {now - self.busy_since:.0f}s")
+            return False
+        self.busy_since = None
+        try:
+            return self._probe()
+        finally:
+            lock.release()
+
+    def _probe(self):
+        """Run the probe script on a helper thread, giving up after response_timeout."""
+        result = {}
+
+        def probe():
+            try:
+                self.scraper.driver.execute_script("return 1")
+                result["ok"] = True
+            except Exception as e:
+                result["error"] = str(e)
+
+        thread = threading.Thread(target=probe, daemon=True)
+        thread.start()
+        thread.join(self.response_timeout)
+        if "error" in result:
+            log.warning("driver_probe_failed", f"WebDriver probe failed: {result['error']}")
+        return result.get("ok", False)
+
+    def close_stray_tabs(self):
+        """Close every tab except the one the scraper works from. Skips if a download is running."""
+        lock = self.scraper.driver_lock
+        if not lock.acquire(timeout=1):
+            return
+        try:
+            driver = self.scraper.driver
+            keep = self.scraper.favorites_window or driver.current_window_handle
+            handles = driver.window_handles
+            stray = [handle for handle in handles if handle != keep]
+            for handle in stray:
+                driver.switch_to.window(handle)
+                driver.close()
+            if stray:
+                driver.switch_to.window(keep)
+                self.stats["tabs_closed"] += len(stray)
+                log.info("tabs_closed", f"Closed {len(stray)} stray tab(s)", open_tabs=len(handles) - len(stray))
+        finally:
+            lock.release()
+
+    def kill_chrome(self):
+        """Kill Chrome's process tree so blocked WebDriver calls fail fast."""
+        processes = self.chrome_processes()
+        for process in reversed(processes):
+            try:
+                process.kill()
+            except psutil.NoSuchProcess:
+                continue
+        psutil.wait_procs(processes, timeout=10)
+
+    def restart(self, reason, kill=False):
+        """Recycle the driver and restore the scraper's session."""
+        log.warning("browser_restarting", f"Restarting browser: {reason}", reason=reason)
+        start_time = time.time()
+        # Before the kill, so the video it interrupts is requeued rather than failed
+        self.scraper.begin_restart()
+        try:
+            if kill:
+                # A hung call may be holding the driver lock; killing Chrome releases it
+                self.kill_chrome()
+            with self.scraper.driver_lock:
+                self.browser_manager.close()
+                self.browser_manager.setup_driver()
+                self.scraper.attach_driver(self.browser_manager.driver)
+                self.scraper.restore_session()
+        finally:
+            # Even after a failed restart, so waiting workers fail instead of hanging
+            self.scraper.driver_ready.set()
+            self.busy_since = None
+        self.stats["restarts"] += 1
+        log.info("browser_restarted", f"Browser restarted in {time.time() - start_time:.1f}s",
+                 reason=reason, restarts=self.stats["restarts"])
@@ -0,0 +1,212 @@
+"""
+Adaptive (AIMD) concurrency control for the TikTok download pipeline.
+"""
+
+import os
+import threading
+import time
+
+import bandwidth
+from event_log import get_logger
+
+log = get_logger("ConcurrencyController")
+
+
+class ConcurrencyController:
+    """Adjusts worker count and navigation gap from observed latency and errors.
+
+    Uses additive-increase / multiplicative-decrease: every clean window of
+    successes adds one worker and shortens the gap between page navigations,
+    while a throttling signal (CAPTCHA, missing download option, timeout, a
+    slow page load, or download throughput falling well below its recent peak
+    or under a floor) halves the workers and doubles the gap.
+    """
+
+    # Failure reasons that indicate TikTok is pushing back on our request rate
+    THROTTLE_REASONS = ("download_option_missing", "download_timeout", "captcha", "page_load_timeout")
+
+    def __init__(self, min_workers=1, max_workers=4, initial_workers=1,
+                 min_gap=1.0, max_gap=60.0, initial_gap=3.0,
+                 target_page_load=8.0, success_window=3, gap_step=0.5,
+                 min_throughput=0.0, throughput_drop=0.5, rate_limiter=None):
+        """Initialize controller limits and starting point."""
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.workers = min(max(initial_workers, self.min_workers), self.max_workers)
+        self.min_gap = min_gap
+        self.max_gap = max(min_gap, max_gap)
+        self.gap = min(max(initial_gap, self.min_gap), self.max_gap)
+        self.target_page_load = target_page_load
+        self.success_window = max(1, success_window)
+        self.gap_step = gap_step
+        self.min_throughput = min_throughput  # bytes/sec; 0 disables the floor
+        self.throughput_drop = throughput_drop  # fraction of the peak EWMA that counts as throttled
+        self.rate_limiter = rate_limiter  # Our own download cap; speed under it says nothing about TikTok
+
+        self.active = 0
+        self.successes_in_window = 0
+        self.last_navigation = 0.0
+        self.condition = threading.Condition()
+
+        # Running statistics for the summary
+        self.stats = {"successes": 0, "failures": 0, "increases": 0, "decreases": 0}
+        self.page_load_ewma = None
+        self.throughput_ewma = None
+        self.throughput_peak = None
+        self.throughput_samples = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a controller from DOWNLOAD_* environment variables."""
+        return cls(
+            min_workers=int(os.getenv("DOWNLOAD_MIN_WORKERS", "1")),
+            max_workers=int(os.getenv("DOWNLOAD_MAX_WORKERS", "4")),
+            initial_workers=int(os.getenv("DOWNLOAD_INITIAL_WORKERS", "1")),
+            min_gap=float(os.getenv("DOWNLOAD_MIN_GAP", "1.0")),
+            max_gap=float(os.getenv("DOWNLOAD_MAX_GAP", "60.0")),
+            initial_gap=float(os.getenv("DOWNLOAD_INITIAL_GAP", "3.0")),
+            target_page_load=float(os.getenv("DOWNLOAD_TARGET_PAGE_LOAD", "8.0")),
+            min_throughput=float(os.getenv("DOWNLOAD_MIN_THROUGHPUT_KB", "0")) * 1024,
+            throughput_drop=float(os.getenv("DOWNLOAD_THROUGHPUT_DROP", "0.5")),
+            rate_limiter=bandwidth.download_limiter(),
+        )
+
+    def acquire_slot(self):
+        """Block until the number of active workers is below the current limit."""
+        with self.condition:
+            while self.active >= self.workers:
+                self.condition.wait()
+            self.active += 1
+
+    def release_slot(self):
+        """Release a worker slot."""
+        with self.condition:
+            self.active = max(0, self.active - 1)
+            self.condition.notify_all()
+
+    def wait_for_navigation(self):
+        """Sleep until the current gap since the previous page navigation has passed."""
+        with self.condition:
+            wait = self.last_navigation + self.gap - time.time()
+            # Reserve the slot now so concurrent callers queue up behind us
+            self.last_navigation = max(time.time(), self.last_navigation + self.gap)
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_success(self, page_load_seconds=None, bytes_per_second=None):
+        """Record a successful download and apply additive increase when warranted."""
+        with self.condition:
+            self.stats["successes"] += 1
+            self.page_load_ewma = self._ewma(self.page_load_ewma, page_load_seconds)
+            self.throughput_ewma = self._ewma(self.throughput_ewma, bytes_per_second)
+
+            if page_load_seconds is not None and page_load_seconds > self.target_page_load:
+                self._decrease(f"slow page load ({page_load_seconds:.1f}s > {self.target_page_load:.1f}s)")
+                return
+
+            throttled = self._throughput_throttled(bytes_per_second)
+            if throttled:
+                self._decrease(throttled)
+                return
+
+            self.successes_in_window += 1
+            if self.successes_in_window >= self.success_window:
+                self.successes_in_window = 0
+                self._increase(f"{self.success_window} clean downloads"
+                               f" (page load {self._fmt(self.page_load_ewma, 's')},"
+                               f" throughput {self._fmt_rate(self.throughput_ewma)})")
+
+    def _throughput_throttled(self, bytes_per_second):
+        """Return the reason if throughput says the CDN is throttling us, else None.
+
+        Caller must hold the condition.
+        """
+        if bytes_per_second is None:
+            return None
+        if self.rate_limiter and self.rate_limiter.current_rate() is not None:
+            # DOWNLOAD_RATE_LIMIT is capping us; start a fresh peak once the cap lifts
+            self.throughput_peak = None
+            self.throughput_samples = 0
+            return None
+        self.throughput_samples += 1
+        ewma = self.throughput_ewma
+        if self.min_throughput and ewma < self.min_throughput:
+            reason = f"throughput {self._fmt_rate(ewma)} below floor {self._fmt_rate(self.min_throughput)}"
+        elif (self.throughput_peak and self.throughput_samples >= self.success_window
+              and ewma < self.throughput_peak * self.throughput_drop):
+            reason = (f"throughput {self._fmt_rate(ewma)} fell below {self.throughput_drop:.0%}"
+                      f" of peak {self._fmt_rate(self.throughput_peak)}")
+        else:
+            self.throughput_peak = max(self.throughput_peak or 0.0, ewma)
+            return None
+        # Measure the next drop against the rate reached at the lower concurrency
+        self.throughput_peak = ewma
+        self.throughput_samples = 0
+        return reason
+
+    def record_failure(self, reason):
+        """Record a failed download; throttling failures trigger multiplicative decrease."""
+        with self.condition:
+            self.stats["failures"] += 1
+            self.successes_in_window = 0
+            if reason in self.THROTTLE_REASONS:
+                self._decrease(reason.replace("_", " "))
+
+    def summary(self):
+        """Return a dict describing the current controller state."""
+        with self.condition:
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "gap": round(self.gap, 2),
+                "page_load_ewma": self.page_load_ewma,
+                "throughput_ewma": self.throughput_ewma,
+                "throughput_peak": self.throughput_peak,
+                **self.stats,
+            }
+
+    def _increase(self, reason):
+        """Additive increase. Caller must hold the condition."""
+        old_workers, old_gap = self.workers, self.gap
+        self.workers = min(self.max_workers, self.workers + 1)
+        self.gap = max(self.min_gap, self.gap - self.gap_step)
+        if (self.workers, self.gap) != (old_workers, old_gap):
+            self.stats["increases"] += 1
+            self._log_change("increase", old_workers, old_gap, reason)
+            self.condition.notify_all()
+
+    def _decrease(self, reason):
+        """Multiplicative decrease. Caller must hold the condition."""
+        old_workers, old_gap = self.workers, self.gap
+        self.successes_in_window = 0
+        self.workers = max(self.min_workers, self.workers // 2)
+        self.gap = min(self.max_gap, self.gap * 2)
+        if (self.workers, self.gap) != (old_workers, old_gap):
+            self.stats["decreases"] += 1
+            self._log_change("decrease", old_workers, old_gap, reason)
+
+    def _log_change(self, direction, old_workers, old_gap, reason):
+        """Log a concurrency change and the reason for it."""
+        log.info(f"concurrency_{direction}",
+                 f"Concurrency {direction}: workers {old_workers} -> {self.workers}, "
+                 f"gap {old_gap:.1f}s -> {self.gap:.1f}s ({reason})",
+                 workers=self.workers, gap=round(self.gap, 2), reason=reason)
+
+    @staticmethod
+    def _ewma(current, sample, alpha=0.3):
+        """Exponentially weighted moving average that ignores missing samples."""
+        if sample is None:
+            return current
+        if current is None:
+            return sample
+        return alpha * sample + (1 - alpha) * current
+
+    @staticmethod
+    def _fmt(value, unit):
+        """Format an optional number for logging."""
+        return "n/a" if value is None else f"{value:.1f}{unit}"
+
+    @staticmethod
+    def _fmt_rate(value):
+        """Format an optional bytes/sec rate for logging."""
+        return "n/a" if value is None else f"{value / 1024 / 1024:.2f} MB/s"
@@ -0,0 +1,275 @@
+"""
+Priority scheduling of queued downloads.
+
+Sits in front of the download stage in place of a plain FIFO queue and picks
+which queued video a free worker takes next. Policies:
+
+    fifo         click order (the default)
+    shortest     shortest video first, by the duration TikTok's favorites API reported
+                 for the tile (see note_durations) or cached page metadata
+    newest       most recently favorited first (top of the favorites page)
+    round_robin  rotate between uploaders so no single account hogs the workers
+
+Any video that has waited longer than max_wait is taken first regardless of
+policy, so nothing starves. Each archived video's time from enqueue to
+archive is logged with the policy in use; compare policies across runs with:
+
+    python download_scheduler.py report logs/events-*.jsonl
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from event_log import get_logger
+from page_extractors import parse_video_url
+
+log = get_logger("DownloadScheduler")
+
+POLICIES = ("fifo", "shortest", "newest", "round_robin")
+
+# Rough TikTok video bitrate, used to turn a file size into a duration estimate
+BYTES_PER_VIDEO_SECOND = 200 * 1024
+
+
+def percentile(values, fraction):
+    """Return the given percentile (0-1) of values by nearest rank, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class DownloadScheduler:
+    """Thread-safe priority queue of video URLs with a drop-in put()/get() interface."""
+
+    def __init__(self, policy="fifo", max_wait=600.0, default_duration=60.0, metadata_cache=None):
+        """Create an empty scheduler using one of POLICIES."""
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown download schedule policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.max_wait = max_wait
+        self.default_duration = default_duration
+        self.metadata_cache = metadata_cache
+        self.known_durations = {}  # video_id -> seconds, from the favorites API
+        self.pending = []
+        self.enqueued_at = {}  # url -> first enqueue time, kept across requeues
+        self.last_served = {}  # uploader -> time a worker last took one of their videos
+        self.sequence = itertools.count()
+        self.running = 0  # Videos handed out by get() and not yet completed or requeued
+        lock = threading.Lock()
+        self.condition = threading.Condition(lock)  # Signals workers waiting in get()
+        self.idle_condition = threading.Condition(lock)  # Signals wait_idle()
+
+        self.latencies = []
+        self.stats = {"queued": 0, "archived": 0, "failed": 0, "aged": 0}
+
+    @classmethod
+    def from_env(cls, metadata_cache=None):
+        """Build a scheduler from DOWNLOAD_SCHEDULE_* environment variables."""
+        return cls(
+            policy=os.getenv("DOWNLOAD_SCHEDULE_POLICY", "fifo").lower(),
+            max_wait=float(os.getenv("DOWNLOAD_SCHEDULE_MAX_WAIT", "600")),
+            default_duration=float(os.getenv("DOWNLOAD_SCHEDULE_DEFAULT_DURATION", "60")),
+            metadata_cache=metadata_cache,
+        )
+
+    def put(self, url, tile_index=None):
+        """Queue a video URL. tile_index is its position on the favorites page (0 is newest)."""
+        video_id, uploader = parse_video_url(url)
+        item = {
+            "url": url,
+            "uploader": uploader or "",
+            "tile_index": tile_index,
+            "duration": self.estimate_duration(video_id) if self.policy == "shortest" else None,
+            "seq": next(self.sequence),
+        }
+        with self.condition:
+            if url not in self.enqueued_at:
+                self.enqueued_at[url] = time.time()
+                self.stats["queued"] += 1
+            item["enqueued_at"] = self.enqueued_at[url]
+            self.pending.append(item)
+            self.condition.notify()
+
+    def note_durations(self, durations):
+        """Record video lengths seen before download ({video_id: seconds}), updating queued videos."""
+        if not durations:
+            return
+        with self.condition:
+            self.known_durations.update(durations)
+            for item in self.pending:
+                video_id = parse_video_url(item["url"])[0]
+                if video_id in durations and self.policy == "shortest":
+                    item["duration"] = durations[video_id]
+
+    def get(self):
+        """Block until a video is queued, then remove and return the best URL to run next."""
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            now = time.time()
+            item, aged = self._pick(now)
+            self.pending.remove(item)
+            self.running += 1
+            self.last_served[item["uploader"]] = now
+            if aged:
+                self.stats["aged"] += 1
+        log.debug("video_scheduled", video_id=parse_video_url(item["url"])[0], policy=self.policy,
+                  waited=round(now - item["enqueued_at"], 1), aged=aged, pending=len(self.pending))
+        return item["url"]
+
+    def qsize(self):
+        """Number of videos waiting."""
+        with self.condition:
+            return len(self.pending)
+
+    def requeue(self, url):
+        """Put a video taken with get() back in the queue, keeping its enqueue time."""
+        self.put(url)
+        with self.condition:
+            self._finish_run()
+
+    def wait_idle(self, timeout=None):
+        """Wait until nothing is queued or running; returns False if timeout passed first."""
+        with self.condition:
+            return self.idle_condition.wait_for(lambda: not self.pending and not self.running, timeout)
+
+    def complete(self, url, archived):
+        """Record the end of a video's run; returns its seconds from enqueue to finish."""
+        with self.condition:
+            self._finish_run()
+            enqueued_at = self.enqueued_at.pop(url, None)
+            if enqueued_at is None:
+                return None
+            seconds = time.time() - enqueued_at
+            if archived:
+                self.stats["archived"] += 1
+                self.latencies.append(seconds)
+            else:
+                self.stats["failed"] += 1
+        return seconds
+
+    def summary(self):
+        """Return the policy's counts plus mean and p95 time from enqueue to archive."""
+        with self.condition:
+            latencies = list(self.latencies)
+            stats = dict(self.stats)
+        return {
+            "policy": self.policy,
+            **stats,
+            "mean_seconds": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p95_seconds": round(percentile(latencies, 0.95), 1) if latencies else None,
+        }
+
+    def estimate_duration(self, video_id):
+        """Estimate a video's length in seconds from the favorites API or cached page metadata."""
+        with self.condition:
+            if video_id in self.known_durations:
+                return self.known_durations[video_id]
+        metadata = self.metadata_cache.get(video_id) if self.metadata_cache and video_id else None
+        if metadata:
+            if metadata.get("duration"):
+                return float(metadata["duration"])
+            video_file = metadata.get("video_file")
+            if video_file and os.path.exists(video_file):
+                return os.path.getsize(video_file) / BYTES_PER_VIDEO_SECOND
+        return self.default_duration
+
+    def _finish_run(self):
+        """Count one video taken with get() as no longer running. Caller must hold the condition."""
+        self.running = max(0, self.running - 1)
+        if not self.running and not self.pending:
+            self.idle_condition.notify_all()
+
+    def _pick(self, now):
+        """Return (item, aged) for the next video. Caller must hold the condition."""
+        starved = [item for item in self.pending if now - item["enqueued_at"] >= self.max_wait]
+        if starved:
+            return min(starved, key=lambda item: item["enqueued_at"]), True
+        if self.policy == "shortest":
+            key = lambda item: (item["duration"], item["seq"])
+        elif self.policy == "newest":
+            # Videos without a tile position (e.g. requeued) go after those with one
+            key = lambda item: (item["tile_index"] is None, item["tile_index"] or 0, item["seq"])
+        elif self.policy == "round_robin":
+            key = lambda item: (self.last_served.get(item["uploader"], 0.0), item["seq"])
+        else:
+            key = lambda item: item["seq"]
+        return min(self.pending, key=key), False
+
+
+def report(paths):
+    """Aggregate video_archived events from event logs into per-policy latency stats."""
+    latencies = defaultdict(list)
+    runs = defaultdict(lambda: {"first": None, "last": None, "archived": 0, "policy": None})
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # A run that crashed can leave a partial last line
+                run = runs[event.get("run_id")]
+                ts = datetime.fromisoformat(event["ts"]).timestamp()
+                if event.get("event") == "video_queued" and run["first"] is None:
+                    run["first"] = ts
+                if event.get("event") == "video_archived" and event.get("queue_seconds") is not None:
+                    latencies[event["policy"]].append(event["queue_seconds"])
+                    run["policy"] = event["policy"]
+                    run["archived"] += 1
+                    run["last"] = ts
+
+    hours = defaultdict(float)
+    archived = defaultdict(int)
+    for run in runs.values():
+        if run["policy"] and run["first"] is not None and run["last"] > run["first"]:
+            hours[run["policy"]] += (run["last"] - run["first"]) / 3600
+            archived[run["policy"]] += run["archived"]
+
+    results = {}
+    for policy, values in latencies.items():
+        results[policy] = {
+            "archived": len(values),
+            "mean_seconds": round(sum(values) / len(values), 1),
+            "p95_seconds": round(percentile(values, 0.95), 1),
+            "videos_per_hour": round(archived[policy] / hours[policy], 1) if hours[policy] else None,
+        }
+    return results
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Compare download schedule policies")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Per-policy time from enqueue to archive")
+    report_parser.add_argument("logs", nargs="+", help="Event log files (JSON Lines); globs are expanded")
+    report_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    paths = [path for pattern in args.logs for path in sorted(glob.glob(pattern)) or [pattern]]
+    results = report(paths)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    if not results:
+        print("No archived videos with queue timings found")
+        return 1
+    print(f"{'policy':<12} {'archived':>9} {'mean s':>9} {'p95 s':>9} {'videos/h':>9}")
+    for policy, entry in sorted(results.items()):
+        rate = entry["videos_per_hour"]
+        print(f"{policy:<12} {entry['archived']:>9} {entry['mean_seconds']:>9.1f} {entry['p95_seconds']:>9.1f} "
+              f"{rate if rate is not None else 'n/a':>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
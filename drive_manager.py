@@ -2,15 +2,46 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
+from datetime import datetime
+import json
 import os
 import pickle
+import threading
+import time
+import bandwidth
+from profiling import profiled
+from event_log import get_logger
+
+log = get_logger("DriveManager")
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+PUBLIC_READER = {'type': 'anyone', 'role': 'reader'}
+# Resumable chunk size while an upload rate limit applies; must be a multiple of 256 KB
+THROTTLED_CHUNK_SIZE = 1024 * 1024
 
 class DriveManager:
     def __init__(self):
         self.SCOPES = ['https://www.googleapis.com/auth/drive.file']
         self.creds = None
-        self.service = None
+        self.local = threading.local()  # One service per thread; httplib2 is not thread-safe
+
+        # Folder layout: flat (Drive root), uploader or month
+        self.folder_layout = os.getenv("DRIVE_FOLDER_LAYOUT", "flat").lower()
+        self.root_folder_name = os.getenv("DRIVE_ROOT_FOLDER", "TikTok Archive")
+        # Sharing: per_file (one grant per upload), inherit (share the root folder once) or batch
+        default_share_mode = "per_file" if self.folder_layout == "flat" else "inherit"
+        self.share_mode = os.getenv("DRIVE_SHARE_MODE", default_share_mode).lower()
+        self.batch_size = int(os.getenv("DRIVE_PERMISSION_BATCH_SIZE", "20"))
+
+        self.folder_cache_path = os.getenv("DRIVE_FOLDER_CACHE", "drive_folders.json")
+        self.folder_cache, self.shared_folders = self.load_folder_cache()
+        self.folder_lock = threading.RLock()  # resolve_folder recurses for parents
+        self.pending_permissions = []  # (file_id, link, on_shared) waiting for a batch
+        self.permission_lock = threading.Lock()
+        self.upload_limiter = bandwidth.upload_limiter()
+
         self.initialize_credentials()
 
     def initialize_credentials(self):
@@ -18,7 +49,7 @@ class DriveManager:
         if os.path.exists('token.pickle'):
             with open('token.pickle', 'rb') as token:
                 self.creds = pickle.load(token)
-        
+
         # If there are no (valid) credentials available, let the user log in
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
@@ -27,39 +58,226 @@ class DriveManager:
                 flow = InstalledAppFlow.from_client_secrets_file(
                     'credentials.json', self.SCOPES)
                 self.creds = flow.run_local_server(port=0)
-            
+
             # Save the credentials for the next run
             with open('token.pickle', 'wb') as token:
                 pickle.dump(self.creds, token)
 
-        self.service = build('drive', 'v3', credentials=self.creds)
+        self.local.service = build('drive', 'v3', credentials=self.creds)
 
-    def upload_file(self, file_path):
-        """Upload a file to Google Drive and return its shareable link."""
+    @property
+    def service(self):
+        """Drive service for the calling thread."""
+        if getattr(self.local, 'service', None) is None:
+            self.local.service = build('drive', 'v3', credentials=self.creds)
+        return self.local.service
+
+    def load_folder_cache(self):
+        """Load the folder path -> folder ID cache and the IDs of shared folders from disk."""
+        try:
+            with open(self.folder_cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}, set()
+        if isinstance(data.get("folders"), dict):
+            return data["folders"], set(data.get("shared", []))
+        # Older caches held only the path -> ID mapping
+        return data, set()
+
+    def save_folder_cache(self):
+        """Write the folder cache to disk. Caller must hold folder_lock."""
         try:
-            file_metadata = {'name': os.path.basename(file_path)}
+            tmp_path = self.folder_cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"folders": self.folder_cache, "shared": sorted(self.shared_folders)}, f, indent=2)
+            os.replace(tmp_path, self.folder_cache_path)
+        except OSError as e:
+            log.warning("folder_cache_error", f"Could not save Drive folder cache: {str(e)}")
+
+    def folder_path_for(self, uploader=None):
+        """Return the folder path (list of names) an upload should go into."""
+        if self.folder_layout == "uploader":
+            return [self.root_folder_name, (uploader or "unknown").replace("/", "_")]
+        if self.folder_layout == "month":
+            return [self.root_folder_name, datetime.now().strftime("%Y-%m")]
+        if self.share_mode == "inherit":
+            return [self.root_folder_name]
+        return []
+
+    def resolve_folder(self, path):
+        """Return the ID of the folder at path, creating folders as needed. Memoized."""
+        if not path:
+            return None
+        key = "/".join(path)
+        # Sharing the root once lets every file below inherit it
+        share = len(path) == 1 and self.share_mode == "inherit"
+        folder_id = self.folder_cache.get(key)
+        if folder_id and (not share or folder_id in self.shared_folders):
+            return folder_id
+
+        with self.folder_lock:
+            # Another thread may have resolved it while we waited
+            folder_id = self.folder_cache.get(key)
+            if folder_id and (not share or folder_id in self.shared_folders):
+                return folder_id
+            if not folder_id:
+                parent_id = self.resolve_folder(path[:-1]) if len(path) > 1 else None
+                folder_id = self.find_folder(path[-1], parent_id) or self.create_folder(path[-1], parent_id)
+            if share:
+                # The root may predate inherit mode or a grant that failed; raise before caching it
+                self.service.permissions().create(fileId=folder_id, body=PUBLIC_READER, fields='id').execute()
+                self.shared_folders.add(folder_id)
+                log.debug("folder_shared", path=key, folder_id=folder_id)
+            self.folder_cache[key] = folder_id
+            self.save_folder_cache()
+            log.debug("folder_resolved", path=key, folder_id=folder_id)
+            return folder_id
+
+    def find_folder(self, name, parent_id=None):
+        """Return the ID of an existing folder with this name under parent_id, or None."""
+        escaped = name.replace("\\", "\\\\").replace("'", "\\'")
+        query = f"name = '{escaped}' and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+        query += f" and '{parent_id or 'root'}' in parents"
+        result = self.service.files().list(q=query, fields='files(id)', pageSize=1).execute()
+        files = result.get('files', [])
+        return files[0]['id'] if files else None
+
+    def create_folder(self, name, parent_id=None):
+        """Create a folder and return its ID."""
+        metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE}
+        if parent_id:
+            metadata['parents'] = [parent_id]
+        folder = self.service.files().create(body=metadata, fields='id').execute()
+        log.info("folder_created", f"Created Drive folder {name}", folder_id=folder['id'])
+        return folder['id']
+
+    def forget_folders(self):
+        """Drop cached folder IDs, e.g. after a folder was deleted in Drive."""
+        with self.folder_lock:
+            self.folder_cache = {}
+            self.shared_folders = set()
+            self.save_folder_cache()
+
+    @profiled("upload_file")
+    def upload_file(self, file_path, uploader=None, on_shared=None):
+        """Upload a file to Google Drive and return its shareable link.
+
+        on_shared(link) is called once the link is publicly readable: right away,
+        or when the batch holding its permission grant is sent.
+        """
+        try:
+            start_time = time.time()
+            try:
+                file_id = self.create_file(file_path, uploader)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                # A cached folder no longer exists
+                log.warning("folder_missing", "Cached Drive folder not found, resolving again", file=file_path)
+                self.forget_folders()
+                file_id = self.create_file(file_path, uploader)
+
+            # Get the shareable link
+            shareable_link = f'https://drive.google.com/uc?id={file_id}'
+
+            if self.share_mode == "batch":
+                self.queue_permission(file_id, shareable_link, on_shared)
+            else:
+                if self.share_mode == "per_file":
+                    # Make the file publicly accessible
+                    self.service.permissions().create(
+                        fileId=file_id,
+                        body=PUBLIC_READER,
+                        fields='id'
+                    ).execute()
+                if on_shared:
+                    on_shared(shareable_link)
+
+            elapsed = max(time.time() - start_time, 0.001)
+            log.debug("file_uploaded", file=file_path, file_id=file_id, seconds=round(elapsed, 2),
+                      bytes_per_second=round(os.path.getsize(file_path) / elapsed))
+
+            return shareable_link
+
+        except Exception as e:
+            log.error("upload_error", f"Error uploading file to Google Drive: {str(e)}", file=file_path)
+            return None
+
+    def create_file(self, file_path, uploader=None):
+        """Upload the file into its layout folder and return the new file ID."""
+        file_metadata = {'name': os.path.basename(file_path)}
+        folder_id = self.resolve_folder(self.folder_path_for(uploader))
+        if folder_id:
+            file_metadata['parents'] = [folder_id]
+        if not self.upload_limiter:
             media = MediaFileUpload(file_path, resumable=True)
-            
+
             # Create the file in Google Drive
             file = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id'
             ).execute()
+            return file.get('id')
 
-            # Make the file publicly accessible
-            self.service.permissions().create(
-                fileId=file.get('id'),
-                body={'type': 'anyone', 'role': 'reader'},
-                fields='id'
-            ).execute()
+        # Send the file in small chunks, each paid for from the shared upload limiter
+        media = MediaFileUpload(file_path, resumable=True, chunksize=THROTTLED_CHUNK_SIZE)
+        request = self.service.files().create(body=file_metadata, media_body=media, fields='id')
+        size = media.size()
+        file = None
+        while file is None:
+            self.upload_limiter.consume(min(THROTTLED_CHUNK_SIZE, size - request.resumable_progress))
+            _, file = request.next_chunk()
+        return file.get('id')
 
-            # Get the shareable link
-            file_id = file.get('id')
-            shareable_link = f'https://drive.google.com/uc?id={file_id}'
-            
-            return shareable_link
-            
+    def queue_permission(self, file_id, link, on_shared):
+        """Queue a public-read grant, sending the batch once it is full."""
+        with self.permission_lock:
+            self.pending_permissions.append((file_id, link, on_shared))
+            full = len(self.pending_permissions) >= self.batch_size
+        if full:
+            self.flush_permissions()
+
+    def flush_permissions(self):
+        """Send all queued permission grants in one batch HTTP request."""
+        with self.permission_lock:
+            pending, self.pending_permissions = self.pending_permissions, []
+        if not pending:
+            return
+
+        shared = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                log.warning("permission_error", f"Error sharing Drive file: {str(exception)}",
+                            file_id=pending[int(request_id)][0])
+            else:
+                shared[int(request_id)] = True
+
+        batch = self.service.new_batch_http_request(callback=on_response)
+        for index, (file_id, _, _) in enumerate(pending):
+            batch.add(self.service.permissions().create(fileId=file_id, body=PUBLIC_READER, fields='id'),
+                      request_id=str(index))
+        try:
+            batch.execute()
         except Exception as e:
-            print(f"Error uploading file to Google Drive: {str(e)}")
-            return None
+            log.error("permission_error", f"Error sending permission batch, sharing files one by one: {str(e)}",
+                      count=len(pending))
+        log.debug("permissions_flushed", count=len(pending), shared=len(shared))
+
+        for index, (file_id, link, on_shared) in enumerate(pending):
+            if index not in shared:
+                # Left private otherwise, and the record would never get its attachment
+                if not self.share_file(file_id):
+                    continue
+            if on_shared:
+                on_shared(link)
+
+    def share_file(self, file_id):
+        """Make one file publicly readable; False (after logging) if the grant failed."""
+        try:
+            self.service.permissions().create(fileId=file_id, body=PUBLIC_READER, fields='id').execute()
+            return True
+        except Exception as e:
+            log.error("permission_error", f"Error sharing Drive file: {str(e)}", file_id=file_id)
+            return False
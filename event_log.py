@@ -0,0 +1,241 @@
+"""
+Structured event logging for the TikTok downloader.
+
+Events are queued from any thread and written as JSON Lines by a single
+background consumer, which also owns the console: it prints messages at or
+above LOG_CONSOLE_LEVEL, keeps a compact live progress line, and prints an
+end-of-run summary on shutdown(). Standalone tools log to the console only,
+unless EVENT_LOG_PATH is set; the pipeline entry points call start_run() to get
+a log file by default.
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# Events counted on the live progress line, in display order
+PROGRESS_EVENTS = (("video_queued", "queued"), ("video_archived", "archived"), ("video_failed", "failed"))
+
+_STOP = object()
+
+
+class EventLog:
+    """Background JSONL writer with a console sink and live progress line."""
+
+    def __init__(self, path=None, console_level="INFO", progress_interval=0.5, stream=None):
+        """Open the log file and start the consumer thread."""
+        self.run_id = uuid.uuid4().hex[:8]
+        self.path = path
+        self.console_level = LEVELS.get(console_level.upper(), LEVELS["INFO"])
+        self.progress_interval = progress_interval
+        self.stream = stream or sys.stdout
+        self.show_progress = self.stream.isatty()
+        self.started = time.time()
+
+        self.file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, "a", encoding="utf-8")
+
+        self.queue = queue.Queue()
+        self.event_counts = Counter()
+        self.level_counts = Counter()
+        self.failure_reasons = Counter()
+        self.progress_drawn = False
+        self.last_progress = 0.0
+
+        self.thread = threading.Thread(target=self._consume, name="event-log", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_env(cls, default_file=False):
+        """Build the log from EVENT_LOG_PATH / LOG_CONSOLE_LEVEL / LOG_CONSOLE_STREAM."""
+        path = os.getenv("EVENT_LOG_PATH")
+        if path is None and default_file:
+            path = os.path.join("logs", f"events-{datetime.now():%Y%m%d-%H%M%S}.jsonl")
+        stream = sys.stderr if os.getenv("LOG_CONSOLE_STREAM", "stdout").lower() == "stderr" else sys.stdout
+        return cls(path=path or None, console_level=os.getenv("LOG_CONSOLE_LEVEL", "INFO"), stream=stream)
+
+    def emit(self, level, component, event, message=None, **fields):
+        """Queue an event; never blocks on I/O."""
+        self.queue.put({
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "run_id": self.run_id,
+            "level": level,
+            "component": component,
+            "event": event,
+            "message": message,
+            "thread": threading.current_thread().name,
+            **fields,
+        })
+
+    def close(self, summary=False):
+        """Drain the queue and stop the consumer, printing the run summary if asked."""
+        if not self.thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self._clear_progress()
+        if summary:
+            print(self.summary(), file=self.stream)
+        if self.file:
+            self.file.close()
+
+    def summary(self):
+        """Return the end-of-run summary as text."""
+        elapsed = time.time() - self.started
+        lines = [
+            "",
+            "Run summary",
+            "===========",
+            f"Run ID: {self.run_id}",
+            f"Duration: {elapsed / 60:.1f} min",
+        ]
+        for event, label in PROGRESS_EVENTS:
+            lines.append(f"Videos {label}: {self.event_counts[event]}")
+        archived = self.event_counts["video_archived"]
+        if elapsed > 0 and archived:
+            lines.append(f"Throughput: {archived / elapsed * 3600:.1f} videos/hour")
+        if self.failure_reasons:
+            lines.append("Failures by reason:")
+            for reason, count in self.failure_reasons.most_common():
+                lines.append(f"  {reason}: {count}")
+        lines.append(f"Warnings: {self.level_counts['WARNING']}, errors: {self.level_counts['ERROR']}")
+        if self.path:
+            lines.append(f"Event log: {self.path}")
+        return "\n".join(lines)
+
+    def _consume(self):
+        """Consumer loop: write each event, echo to console, refresh progress."""
+        while True:
+            try:
+                event = self.queue.get(timeout=self.progress_interval)
+            except queue.Empty:
+                self._draw_progress()
+                continue
+            if event is _STOP:
+                break
+            self._handle(event)
+            # Batch file writes while events keep arriving
+            while not self.queue.empty():
+                event = self.queue.get_nowait()
+                if event is _STOP:
+                    self._flush()
+                    return
+                self._handle(event)
+            self._flush()
+            self._draw_progress()
+
+    def _handle(self, event):
+        """Record a single event."""
+        self.event_counts[event["event"]] += 1
+        self.level_counts[event["level"]] += 1
+        if event["event"] == "video_failed":
+            self.failure_reasons[event.get("reason") or "unknown"] += 1
+        if self.file:
+            self.file.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+        if LEVELS[event["level"]] >= self.console_level:
+            self._clear_progress()
+            print(self._format_console(event), file=self.stream)
+
+    def _flush(self):
+        """Flush the log file."""
+        if self.file:
+            self.file.flush()
+
+    def _format_console(self, event):
+        """Format an event as a single console line."""
+        prefix = "" if event["level"] == "INFO" else f"{event['level']}: "
+        video = f"[{event['video_id']}] " if event.get("video_id") else ""
+        return f"{prefix}{video}{event['message'] or event['event']}"
+
+    def _draw_progress(self):
+        """Redraw the live progress line, rate-limited for slow consoles."""
+        if not self.show_progress or time.time() - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = time.time()
+        elapsed_min = max((time.time() - self.started) / 60, 1 / 60)
+        parts = [f"{label} {self.event_counts[event]}" for event, label in PROGRESS_EVENTS]
+        rate = self.event_counts["video_archived"] / elapsed_min
+        self.stream.write(f"\r\x1b[K[{datetime.now():%H:%M:%S}] {' | '.join(parts)} | {rate:.1f}/min")
+        self.stream.flush()
+        self.progress_drawn = True
+
+    def _clear_progress(self):
+        """Erase the progress line so a message can be printed in its place."""
+        if self.progress_drawn:
+            self.stream.write("\r\x1b[K")
+            self.progress_drawn = False
+            self.last_progress = 0.0
+
+
+class Logger:
+    """Component logger with bound fields such as a per-video correlation ID."""
+
+    def __init__(self, component, **fields):
+        self.component = component
+        self.fields = fields
+
+    def bind(self, **fields):
+        """Return a logger that adds the given fields to every event."""
+        return Logger(self.component, **{**self.fields, **fields})
+
+    def debug(self, event, message=None, **fields):
+        self._emit("DEBUG", event, message, fields)
+
+    def info(self, event, message=None, **fields):
+        self._emit("INFO", event, message, fields)
+
+    def warning(self, event, message=None, **fields):
+        self._emit("WARNING", event, message, fields)
+
+    def error(self, event, message=None, **fields):
+        self._emit("ERROR", event, message, fields)
+
+    def _emit(self, level, event, message, fields):
+        get_event_log().emit(level, self.component, event, message, **{**self.fields, **fields})
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+_run_started = False
+
+
+def get_event_log():
+    """Return the process-wide event log, creating it on first use."""
+    global _event_log
+    with _event_log_lock:
+        if _event_log is None:
+            _event_log = EventLog.from_env(default_file=_run_started)
+            # Only flushes; the summary is printed by shutdown()
+            atexit.register(_event_log.close)
+        return _event_log
+
+
+def get_logger(component, **fields):
+    """Return a logger for the named component."""
+    return Logger(component, **fields)
+
+
+def start_run():
+    """Mark this process as a pipeline run, logging to logs/events-<timestamp>.jsonl by default.
+
+    Call before the first event is logged.
+    """
+    global _run_started
+    _run_started = True
+
+
+def shutdown():
+    """Flush pending events and print the end-of-run summary."""
+    if _event_log is not None:
+        _event_log.close(summary=True)
@@ -2,10 +2,13 @@
 File system event handlers and HTTP server handlers for the TikTok downloader.
 """
 
-import os
 import time
+import threading
 import http.server
 from watchdog.events import FileSystemEventHandler
+from event_log import get_logger
+
+log = get_logger("DownloadHandler")
 
 class DownloadHandler(FileSystemEventHandler):
     """Handles file system events for downloaded TikTok videos."""
@@ -16,32 +19,31 @@ class DownloadHandler(FileSystemEventHandler):
         self.video_id = video_id
         self.source_url = source_url
         self.found_file = None
-        print(f"\nFile monitoring initialized for video {video_id}")
+        self.found_event = threading.Event()  # Set once found_file is known
+        self.log = log.bind(video_id=video_id)
+        self.log.debug("monitor_initialized", source_url=source_url)
         
     def on_created(self, event):
         """Called when a file is created in the monitored directory."""
-        print(f"\nFile created event detected!")
-        print(f"Path: {event.src_path}")
-        print(f"Is directory: {event.is_directory}")
-        print(f"Source URL for record: {self.source_url}")  # Debug print
+        self.log.debug("file_created", path=event.src_path, is_directory=event.is_directory)
         if not event.is_directory:
-            print(f"File extension: {os.path.splitext(event.src_path)[1]}")
-            
             # If this is a video file, note it but don't create record yet
             if event.src_path.endswith(('.mp4', '.webm')):
-                print(f"\nNew video file detected: {event.src_path}")
-                self.found_file = event.src_path
+                self.set_found_file(event.src_path)
 
     def on_moved(self, event):
         """Called when a file is moved or renamed in the monitored directory."""
-        print(f"\nFile moved/renamed event detected!")
-        print(f"Source path: {event.src_path}")
-        print(f"Destination path: {event.dest_path}")
+        self.log.debug("file_moved", src_path=event.src_path, dest_path=event.dest_path)
         
         # If this is the final move (download complete)
         if event.dest_path.endswith('.mp4') and not event.dest_path.endswith('.crdownload'):
-            print(f"\nDownload completed: {event.dest_path}")
-            self.found_file = event.dest_path  # Use dest_path for final file location
+            self.set_found_file(event.dest_path)  # Use dest_path for final file location
+
+    def set_found_file(self, path):
+        """Record the downloaded file and wake anyone waiting for it."""
+        self.found_file = path
+        self.found_event.set()
+        self.log.debug("video_file_detected", path=path)
 
 class SimpleHTTPRequestHandlerWithCORS(http.server.SimpleHTTPRequestHandler):
     """HTTP request handler with CORS support."""
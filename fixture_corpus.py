@@ -0,0 +1,179 @@
+"""
+Records visited TikTok pages to a compressed fixture archive and replays the
+offline extractors against it.
+
+Capture is enabled by setting FIXTURE_CAPTURE_PATH, e.g.
+FIXTURE_CAPTURE_PATH=fixtures/pages.jsonl.gz. Replay with:
+
+    python fixture_corpus.py replay fixtures/pages.jsonl.gz
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import page_extractors
+from event_log import get_logger
+
+log = get_logger("FixtureRecorder")
+
+
+class FixtureRecorder:
+    """Appends page snapshots to a gzip-compressed JSON Lines archive."""
+
+    def __init__(self, path):
+        """Open the archive for appending."""
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = gzip.open(path, "ab")
+        self.lock = threading.Lock()
+        self.count = 0
+        log.info("fixture_capture_started", f"Capturing page fixtures to {path}", path=path)
+
+    @classmethod
+    def from_env(cls):
+        """Return a recorder if FIXTURE_CAPTURE_PATH is set, otherwise None."""
+        path = os.getenv("FIXTURE_CAPTURE_PATH")
+        return cls(path) if path else None
+
+    def capture(self, kind, url, html, expected):
+        """Store one page snapshot along with the live extractor results."""
+        fixture = {
+            "kind": kind,
+            "url": url,
+            "captured_at": datetime.now().isoformat(),
+            "html": html,
+            "embedded_json": page_extractors.extract_embedded_json(html),
+            "expected": expected,
+        }
+        line = json.dumps(fixture, ensure_ascii=False)
+        with self.lock:
+            self.file.write((line + "\n").encode("utf-8"))
+            # Sync flush so a crashed run still leaves readable fixtures
+            self.file.flush(zlib.Z_SYNC_FLUSH)
+            self.count += 1
+
+    def close(self):
+        """Close the archive."""
+        with self.lock:
+            self.file.close()
+        log.info("fixture_capture_finished", f"Captured {self.count} page fixtures", count=self.count)
+
+
+def iter_fixtures(path):
+    """Yield fixtures from an archive, tolerating a truncated final member."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, zlib.error):
+            # Archive from a run that did not close cleanly
+            return
+
+
+def _video_checks(fixture):
+    """Extractor name -> (callable, expected value) for a video page fixture.
+
+    When the live selector found nothing, the embedded JSON is the ground
+    truth, so a renamed class shows up as a drop in the select_* accuracy
+    instead of an unscored fixture.
+    """
+    html, embedded, expected = fixture["html"], fixture.get("embedded_json"), fixture["expected"]
+    description = expected.get("description") or page_extractors.embedded_description(embedded)
+    uploader = expected.get("uploader") or page_extractors.embedded_uploader(embedded)
+    return {
+        "parse_video_url": (lambda: page_extractors.parse_video_url(fixture["url"])[0], expected.get("video_id")),
+        "select_description": (lambda: page_extractors.select_description(html), description),
+        "extract_description": (lambda: page_extractors.extract_description(html, embedded), description),
+        "select_uploader": (lambda: page_extractors.select_uploader(html), uploader),
+        "extract_uploader": (lambda: page_extractors.extract_uploader(html, embedded), uploader),
+    }
+
+
+def _favorites_checks(fixture):
+    """Extractor name -> (callable, expected value) for a favorites page fixture."""
+    return {
+        "extract_favorite_links": (lambda: page_extractors.extract_favorite_links(fixture["html"]),
+                                   fixture["expected"].get("links")),
+    }
+
+
+CHECKS = {"video": _video_checks, "favorites": _favorites_checks}
+
+
+def replay(path, limit=None):
+    """Run every extractor against the fixtures and return per-extractor stats."""
+    stats = {}
+    fixtures = 0
+    for fixture in iter_fixtures(path):
+        if limit and fixtures >= limit:
+            break
+        checks = CHECKS.get(fixture.get("kind"))
+        if not checks:
+            continue
+        fixtures += 1
+        for name, (extract, expected) in checks(fixture).items():
+            entry = stats.setdefault(name, {"runs": 0, "scored": 0, "correct": 0, "errors": 0, "seconds": 0.0})
+            start = time.perf_counter()
+            try:
+                actual = extract()
+            except Exception:
+                actual = None
+                entry["errors"] += 1
+            entry["seconds"] += time.perf_counter() - start
+            entry["runs"] += 1
+            # Fixtures where the live extractor also failed carry no ground truth
+            if expected is not None:
+                entry["scored"] += 1
+                if actual == expected:
+                    entry["correct"] += 1
+    return fixtures, stats
+
+
+def print_report(fixtures, stats, elapsed):
+    """Print per-extractor accuracy and throughput."""
+    print(f"Replayed {fixtures} fixtures in {elapsed:.2f}s")
+    print(f"{'extractor':<24} {'accuracy':>9} {'scored':>7} {'of runs':>8} {'errors':>7} {'pages/s':>10}")
+    for name, entry in sorted(stats.items()):
+        accuracy = f"{entry['correct'] / entry['scored']:.1%}" if entry["scored"] else "n/a"
+        rate = entry["runs"] / entry["seconds"] if entry["seconds"] else float("inf")
+        print(f"{name:<24} {accuracy:>9} {entry['scored']:>7} {entry['scored'] / entry['runs']:>8.0%} "
+              f"{entry['errors']:>7} {rate:>10.0f}")
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Replay recorded TikTok page fixtures")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="Run extractors against a fixture archive")
+    replay_parser.add_argument("path", help="Path to a .jsonl.gz fixture archive")
+    replay_parser.add_argument("--limit", type=int, help="Only replay the first N fixtures")
+    replay_parser.add_argument("--min-accuracy", type=float, default=0.0,
+                               help="Exit non-zero if any extractor scores below this fraction")
+    replay_parser.add_argument("--min-scored", type=float, default=0.0,
+                               help="Exit non-zero if any extractor has ground truth for fewer than this "
+                                    "fraction of fixtures")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    fixtures, stats = replay(args.path, args.limit)
+    print_report(fixtures, stats, time.perf_counter() - start)
+
+    failing = [name for name, entry in stats.items()
+               if entry["scored"] and entry["correct"] / entry["scored"] < args.min_accuracy
+               or entry["runs"] and entry["scored"] / entry["runs"] < args.min_scored]
+    if failing:
+        print(f"Below threshold: {', '.join(sorted(failing))}", file=sys.stderr)
+    return 1 if failing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,14 +8,20 @@ from selenium.webdriver.common.by import By
 from browser_manager import BrowserManager
 from airtable_manager import AirtableManager
 from tiktok_scraper import TikTokScraper
+from browser_supervisor import BrowserSupervisor
+import event_log
+import profiling
 import time
 
 def main():
     """Main function to run the TikTok downloader"""
+    event_log.start_run()
     print("TikTok Saved Videos Downloader")
     print("=============================")
     print("This script will help you download your saved TikTok videos.\n")
     
+    airtable = None
+    browser = None
     try:
         # Load environment variables
         load_dotenv()
@@ -27,21 +33,31 @@ def main():
         else:
             print("Using default Chrome profile")
         
-        print("\nIMPORTANT: Please make sure ALL Chrome windows are closed!")
-        print("Waiting 5 seconds before starting...")
-        time.sleep(5)
+        # Only the live profile is locked by a running Chrome; the default clone mode is not
+        if os.getenv('CHROME_PROFILE_MODE', 'clone').lower() == 'live':
+            print("\nIMPORTANT: Please make sure ALL Chrome windows are closed!")
+            print("Waiting 5 seconds before starting...")
+            time.sleep(5)
         
         # Initialize components
         airtable = AirtableManager()
         browser = BrowserManager(profile_name)
         scraper = TikTokScraper(browser.driver, airtable)
+        scraper.supervisor = BrowserSupervisor.from_env(browser, scraper)
         scraper.browse_favorites()
         
     except KeyboardInterrupt:
         print("\n\nScript interrupted by user.")
     except Exception as e:
-        print(f"Error in main: {str(e)}")
+        event_log.get_logger("main").error("main_error", f"Error in main: {str(e)}")
     finally:
+        if airtable:
+            airtable.close()
+        if browser:
+            browser.cleanup()
+        profiling.shutdown()
+        # Flush the event log and print the end-of-run summary
+        event_log.shutdown()
         print("\nScript finished. Thanks for using TikTok Saved Videos Downloader!")
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+"""
+Disk-backed cache of per-video page metadata.
+
+The first visit to a video page stores what was extracted from it (description,
+uploader, media URL, cover, duration) and, once downloaded, the local file.
+A retry can then skip the page entirely: it reuses the file if it is still on
+disk, or fetches the media URL directly while that URL has not expired.
+Entries expire after a TTL and the least recently used ones are evicted once
+the cache holds more than max_entries videos.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from event_log import get_logger
+
+log = get_logger("MetadataCache")
+
+# Query parameters TikTok CDN URLs carry their expiry time in (Unix seconds)
+EXPIRY_PARAMS = ("x-expires", "expire", "expires")
+
+
+def media_url_expiry(url):
+    """Return the Unix time a signed media URL expires at, or None if it does not say."""
+    query = parse_qs(urlparse(url).query)
+    for name in EXPIRY_PARAMS:
+        try:
+            return int(query[name][0])
+        except (KeyError, ValueError, IndexError):
+            continue
+    return None
+
+
+class MetadataCache:
+    """SQLite table of video_id -> metadata JSON with TTL and LRU eviction."""
+
+    def __init__(self, path, ttl=72 * 3600, max_entries=5000, media_ttl=3600, expiry_margin=120):
+        """Open (or create) the cache at path."""
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.media_ttl = media_ttl  # For media URLs that carry no expiry time
+        self.expiry_margin = expiry_margin
+        self.lock = threading.Lock()  # One connection shared by the worker threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS page_cache ("
+            " video_id TEXT PRIMARY KEY,"
+            " metadata TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS page_cache_last_used ON page_cache(last_used)")
+        self.conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from PAGE_CACHE_* variables; None when PAGE_CACHE_PATH is empty."""
+        path = os.getenv("PAGE_CACHE_PATH", "page_cache.sqlite3")
+        if not path:
+            return None
+        return cls(
+            path,
+            ttl=float(os.getenv("PAGE_CACHE_TTL_HOURS", "72")) * 3600,
+            max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "5000")),
+            media_ttl=float(os.getenv("PAGE_CACHE_MEDIA_TTL", "3600")),
+        )
+
+    def get(self, video_id):
+        """Return the cached metadata for a video, or None if missing or expired."""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT metadata, fetched_at FROM page_cache WHERE video_id = ?",
+                                    (video_id,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM page_cache WHERE video_id = ?", (video_id,))
+                self.stats["expired"] += 1
+                return None
+            self.conn.execute("UPDATE page_cache SET last_used = ? WHERE video_id = ?", (now, video_id))
+            self.stats["hits"] += 1
+        metadata = json.loads(row[0])
+        metadata["fetched_at"] = row[1]
+        return metadata
+
+    def put(self, video_id, **fields):
+        """Merge fields into a video's entry, starting a new TTL if the page was just read."""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT metadata, fetched_at FROM page_cache WHERE video_id = ?",
+                                    (video_id,)).fetchone()
+            metadata = json.loads(row[0]) if row else {}
+            metadata.update(fields)
+            # Only a fresh page read renews the entry; adding the downloaded file does not
+            fetched_at = now if row is None or "media_url" in fields else row[1]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO page_cache (video_id, metadata, fetched_at, last_used) VALUES (?, ?, ?, ?)",
+                (video_id, json.dumps(metadata), fetched_at, now),
+            )
+            self._evict()
+
+    def forget(self, video_id):
+        """Drop a video's entry, e.g. after its media URL was refused."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM page_cache WHERE video_id = ?", (video_id,))
+
+    def media_url_valid(self, metadata):
+        """True if the cached media URL can still be fetched without revisiting the page."""
+        url = metadata.get("media_url")
+        if not url:
+            return False
+        expires = media_url_expiry(url) or metadata["fetched_at"] + self.media_ttl
+        return time.time() < expires - self.expiry_margin
+
+    def _evict(self):
+        """Delete the least recently used entries beyond max_entries. Caller holds the lock."""
+        excess = self.conn.execute("SELECT COUNT(*) FROM page_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM page_cache WHERE video_id IN"
+                " (SELECT video_id FROM page_cache ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self.stats["evicted"] += excess
+            log.debug("cache_evicted", count=excess)
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,228 @@
+"""
+Browser-free extractors that read TikTok page HTML.
+
+These mirror the Selenium lookups in tiktok_scraper.py so they can be run
+offline against recorded fixtures (see fixture_corpus.py).
+"""
+
+import json
+from html.parser import HTMLParser
+
+# Selectors shared with the live Selenium extractors
+DESCRIPTION_SELECTOR = "span.css-j2a19r-SpanText"
+UPLOADER_SELECTOR = "h3[data-e2e='browse-username']"
+MENU_ITEM_SELECTOR = "span.css-108oj9l-SpanItemText"
+FAVORITE_TILE_SELECTOR = 'div[class*="DivContainer-StyledDivContainerV2"]'
+
+# Paged JSON the favorites grid is loaded from; each item carries the video's duration
+FAVORITES_API_PATH = "/api/favorite/item_list"
+
+EMBEDDED_JSON_IDS = ("__UNIVERSAL_DATA_FOR_REHYDRATION__", "SIGI_STATE")
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input",
+             "link", "meta", "source", "track", "wbr"}
+
+
+class _ElementCollector(HTMLParser):
+    """Collects text (and optionally the first nested link) of matching elements."""
+
+    def __init__(self, matches, want_link=False):
+        super().__init__(convert_charrefs=True)
+        self.matches = matches
+        self.want_link = want_link
+        self.results = []
+        self.depth = 0  # Nesting depth inside the current match, 0 when outside
+        self.text = []
+        self.link = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        if self.depth:
+            self.depth += 1
+            if self.want_link and tag == "a" and self.link is None:
+                self.link = dict(attrs).get("href")
+        elif self.matches(tag, dict(attrs)):
+            self.depth = 1
+            self.text = []
+            self.link = None
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS or not self.depth:
+            return
+        self.depth -= 1
+        if not self.depth:
+            text = "".join(self.text).strip()
+            self.results.append((text, self.link) if self.want_link else text)
+
+    def handle_data(self, data):
+        if self.depth:
+            self.text.append(data)
+
+
+class _ScriptCollector(HTMLParser):
+    """Collects the contents of <script> tags with the given ids."""
+
+    def __init__(self, ids):
+        super().__init__(convert_charrefs=False)
+        self.ids = ids
+        self.current = None
+        self.scripts = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script" and dict(attrs).get("id") in self.ids:
+            self.current = dict(attrs)["id"]
+            self.scripts[self.current] = []
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self.current = None
+
+    def handle_data(self, data):
+        if self.current:
+            self.scripts[self.current].append(data)
+
+
+class _SourceCollector(HTMLParser):
+    """Collects the src attributes of <video> and <source> tags."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sources = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("video", "source"):
+            self.sources.append(dict(attrs).get("src") or "")
+
+
+def _collect(html, matches, want_link=False):
+    """Run an element collector over html and return its results."""
+    collector = _ElementCollector(matches, want_link)
+    collector.feed(html)
+    collector.close()
+    return collector.results
+
+
+def _has_class(attrs, fragment):
+    """True if the element's class attribute contains the given fragment."""
+    return fragment in (attrs.get("class") or "")
+
+
+def parse_video_url(url):
+    """Split a TikTok video URL into (video_id, uploader); either may be None."""
+    if not url:
+        return None, None
+    path = url.split("?")[0].split("#")[0].rstrip("/")
+    video_id = path.split("/video/")[1].split("/")[0] if "/video/" in path else None
+    uploader = path.split("/@")[1].split("/")[0] if "/@" in path else None
+    return video_id or None, uploader or None
+
+
+def extract_item_list_durations(payload):
+    """Return {video_id: duration in seconds} from a favorites item_list API response."""
+    durations = {}
+    items = payload.get("itemList") if isinstance(payload, dict) else None
+    for item in items or []:
+        video = item.get("video") if isinstance(item, dict) else None
+        if isinstance(video, dict) and item.get("id") and video.get("duration"):
+            durations[str(item["id"])] = float(video["duration"])
+    return durations
+
+
+def extract_embedded_json(html):
+    """Return the first embedded state JSON blob on the page as a dict, or None."""
+    collector = _ScriptCollector(EMBEDDED_JSON_IDS)
+    collector.feed(html)
+    collector.close()
+    for script_id in EMBEDDED_JSON_IDS:
+        raw = "".join(collector.scripts.get(script_id, []))
+        if raw:
+            try:
+                return json.loads(raw)
+            except ValueError:
+                continue
+    return None
+
+
+def extract_item_struct(embedded):
+    """Return the video item dict from embedded state JSON, or None."""
+    if not embedded:
+        return None
+    try:
+        return embedded["__DEFAULT_SCOPE__"]["webapp.video-detail"]["itemInfo"]["itemStruct"]
+    except (KeyError, TypeError):
+        pass
+    # Older pages keep items in SIGI_STATE.ItemModule keyed by video ID
+    items = embedded.get("ItemModule") if isinstance(embedded, dict) else None
+    if items:
+        return next(iter(items.values()))
+    return None
+
+
+def select_description(html):
+    """Return the video description using only the live selector, like the Selenium lookup."""
+    spans = _collect(html, lambda tag, attrs: tag == "span" and _has_class(attrs, "css-j2a19r-SpanText"))
+    return spans[0] if spans and spans[0] else None
+
+
+def embedded_description(embedded):
+    """Return the video description from embedded state JSON, or None."""
+    return (extract_item_struct(embedded) or {}).get("desc") or None
+
+
+def extract_description(html, embedded=None):
+    """Return the video description from page HTML, falling back to embedded JSON."""
+    return select_description(html) or embedded_description(
+        embedded if embedded is not None else extract_embedded_json(html))
+
+
+def select_uploader(html):
+    """Return the uploader's username using only the live selector, like the Selenium lookup."""
+    names = _collect(html, lambda tag, attrs: tag == "h3" and attrs.get("data-e2e") == "browse-username")
+    return names[0] if names and names[0] else None
+
+
+def embedded_uploader(embedded):
+    """Return the uploader's username from embedded state JSON, or None."""
+    author = (extract_item_struct(embedded) or {}).get("author")
+    if isinstance(author, dict):
+        return author.get("uniqueId")
+    return author or None
+
+
+def extract_uploader(html, embedded=None):
+    """Return the uploader's username from page HTML, falling back to embedded JSON."""
+    return select_uploader(html) or embedded_uploader(
+        embedded if embedded is not None else extract_embedded_json(html))
+
+
+def extract_favorite_links(html):
+    """Return the video links of every favorites tile, in page order."""
+    tiles = _collect(
+        html,
+        lambda tag, attrs: tag == "div" and _has_class(attrs, "DivContainer-StyledDivContainerV2"),
+        want_link=True,
+    )
+    return [link for _, link in tiles if link]
+
+
+def extract_media_info(html, embedded=None):
+    """Return the video's media URL, cover image URL and duration in seconds from page HTML.
+
+    Values come from the embedded item JSON, with the <video> element's source
+    as a fallback for the media URL. Missing values are None.
+    """
+    item = extract_item_struct(embedded if embedded is not None else extract_embedded_json(html)) or {}
+    video = item.get("video") if isinstance(item.get("video"), dict) else {}
+    media_url = video.get("downloadAddr") or video.get("playAddr") or None
+    if not media_url:
+        collector = _SourceCollector()
+        collector.feed(html)
+        collector.close()
+        # blob: URLs only exist inside the page that created them
+        media_url = next((src for src in collector.sources if src.startswith("http")), None)
+    return {
+        "media_url": media_url,
+        "cover_url": video.get("originCover") or video.get("cover") or None,
+        "duration": video.get("duration") or None,
+    }
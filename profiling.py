@@ -0,0 +1,244 @@
+"""
+Opt-in sampling profiler and allocation tracking for the pipeline stages.
+
+Enabled by setting PROFILE_DIR (or `batch_cli.py --profile-dir DIR`). While a
+thread is inside a stage wrapped with @profiled, a sampler thread records its
+stack every PROFILE_SAMPLE_MS milliseconds. Each stage gets a folded-stack
+file (<dir>/<stage>.folded) that flamegraph.pl or speedscope.app can open.
+Samples are wall-clock, so time blocked on WebDriver or HTTP shows up next to
+time spent computing.
+
+With tracing on, tracemalloc snapshots are compared every PROFILE_MEMORY_EVERY
+videos and the lines whose allocations grew most are written to
+<dir>/memory-NNNN.txt. Per-stage call counts, time and net allocations go to
+<dir>/stages.json.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from event_log import get_logger
+
+log = get_logger("Profiler")
+
+# Frames from the profiler itself are noise in the memory diffs
+IGNORED_TRACES = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+
+
+class Profiler:
+    """Samples the stacks of threads inside named stages and tracks memory growth."""
+
+    def __init__(self, output_dir, sample_interval=0.005, memory_every=25, trace_frames=10):
+        """Create the output directory and start the sampler thread."""
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.memory_every = memory_every
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # Workers may finish videos at the same time
+        self.active = defaultdict(list)  # thread id -> stack of stage names
+        self.samples = defaultdict(Counter)  # stage -> folded stack -> count
+        self.stage_stats = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "net_alloc_bytes": 0})
+        self.videos = 0
+        self.snapshots_written = 0
+        self.last_snapshot = None
+
+        if memory_every and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+        if tracemalloc.is_tracing():
+            self.last_snapshot = self._snapshot()
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self.thread.start()
+        log.info("profiling_started", f"Profiling to {output_dir}", output_dir=output_dir,
+                 sample_ms=round(sample_interval * 1000, 1), memory_every=memory_every)
+
+    @classmethod
+    def from_env(cls):
+        """Build a profiler from PROFILE_* variables; None unless PROFILE_DIR is set."""
+        output_dir = os.getenv("PROFILE_DIR")
+        if not output_dir:
+            return None
+        return cls(
+            output_dir,
+            sample_interval=float(os.getenv("PROFILE_SAMPLE_MS", "5")) / 1000,
+            memory_every=int(os.getenv("PROFILE_MEMORY_EVERY", "25")),
+            trace_frames=int(os.getenv("PROFILE_TRACE_FRAMES", "10")),
+        )
+
+    def enter(self, stage):
+        """Mark the calling thread as inside stage; returns a token for leave()."""
+        with self.lock:
+            self.active[threading.get_ident()].append(stage)
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        return stage, time.perf_counter(), memory
+
+    def leave(self, token):
+        """Mark the calling thread as having left the stage entered with token."""
+        stage, start, memory = token
+        elapsed = time.perf_counter() - start
+        growth = tracemalloc.get_traced_memory()[0] - memory if tracemalloc.is_tracing() else 0
+        thread_id = threading.get_ident()
+        with self.lock:
+            stack = self.active[thread_id]
+            if stack and stack[-1] == stage:
+                stack.pop()
+            if not stack:
+                del self.active[thread_id]
+            stats = self.stage_stats[stage]
+            stats["calls"] += 1
+            stats["seconds"] += elapsed
+            # Other threads allocate meanwhile, so this is indicative rather than exact
+            stats["net_alloc_bytes"] += growth
+
+    def video_done(self):
+        """Count a finished video; every memory_every videos, diff memory and write profiles."""
+        with self.lock:
+            self.videos += 1
+            due = self.memory_every and self.videos % self.memory_every == 0
+        if due:
+            with self.write_lock:
+                self.write_memory_delta()
+                self.write_profiles()
+
+    def write_memory_delta(self):
+        """Write the allocation growth since the previous snapshot."""
+        if not tracemalloc.is_tracing():
+            return
+        snapshot = self._snapshot()
+        differences = snapshot.compare_to(self.last_snapshot, "lineno")
+        self.last_snapshot = snapshot
+        growth = sum(stat.size_diff for stat in differences)
+        current, peak = tracemalloc.get_traced_memory()
+
+        self.snapshots_written += 1
+        path = os.path.join(self.output_dir, f"memory-{self.snapshots_written:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"After {self.videos} videos: traced {current / 1024 / 1024:.1f} MB "
+                    f"(peak {peak / 1024 / 1024:.1f} MB), growth {growth / 1024:+.1f} KB "
+                    f"since the previous snapshot\n\n")
+            for stat in differences[:30]:
+                f.write(f"{stat}\n")
+        log.info("memory_delta",
+                 f"Memory grew {growth / 1024:+.1f} KB since the previous snapshot ({self.videos} videos so far)",
+                 videos=self.videos, growth_bytes=growth, traced_bytes=current, peak_bytes=peak, report=path)
+
+    def write_profiles(self):
+        """Write one folded-stack file per stage plus the per-stage summary."""
+        with self.lock:
+            samples = {stage: Counter(counter) for stage, counter in self.samples.items()}
+            stage_stats = {stage: dict(stats) for stage, stats in self.stage_stats.items()}
+        for stage, counter in samples.items():
+            with open(os.path.join(self.output_dir, f"{stage}.folded"), "w", encoding="utf-8") as f:
+                for stack, count in counter.most_common():
+                    f.write(f"{stack} {count}\n")
+        for stage, stats in stage_stats.items():
+            stats["samples"] = sum(samples.get(stage, {}).values())
+            stats["seconds"] = round(stats["seconds"], 3)
+        with open(os.path.join(self.output_dir, "stages.json"), "w", encoding="utf-8") as f:
+            json.dump({"videos": self.videos, "stages": stage_stats}, f, indent=2)
+
+    def close(self):
+        """Stop sampling and write the final profiles."""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.thread.join()
+        with self.write_lock:
+            self.write_profiles()
+            self.write_memory_delta()
+        log.info("profiling_finished", f"Wrote profiles to {self.output_dir}", output_dir=self.output_dir,
+                 videos=self.videos)
+
+    def _sample_loop(self):
+        """Record the stack of every thread that is inside a stage."""
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.sample_interval):
+            with self.lock:
+                active = {thread_id: set(stack) for thread_id, stack in self.active.items() if stack}
+            if not active:
+                continue
+            frames = sys._current_frames()
+            folded = {}
+            for thread_id, stages in active.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                folded[thread_id] = (self._fold(frame), stages)
+            with self.lock:
+                for stack, stages in folded.values():
+                    # Stages nest (create_record calls upload_file), so each counts the sample
+                    for stage in stages:
+                        self.samples[stage][stack] += 1
+
+    def _fold(self, frame):
+        """Return a frame's call stack as 'outer;...;inner' for flame graph tools."""
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _snapshot(self):
+        """Take a tracemalloc snapshot without the profiler's own allocations."""
+        return tracemalloc.take_snapshot().filter_traces(IGNORED_TRACES)
+
+
+_profiler = None
+_profiler_loaded = False
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide profiler, or None if profiling is off."""
+    global _profiler, _profiler_loaded
+    if _profiler_loaded:
+        return _profiler
+    with _profiler_lock:
+        if not _profiler_loaded:
+            _profiler = Profiler.from_env()
+            if _profiler:
+                atexit.register(_profiler.close)
+            _profiler_loaded = True
+        return _profiler
+
+
+def profiled(stage):
+    """Decorator that profiles every call of a function as the named stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = get_profiler()
+            if profiler is None:
+                return func(*args, **kwargs)
+            token = profiler.enter(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.leave(token)
+        return wrapper
+    return decorator
+
+
+def video_done():
+    """Count a finished video towards the next memory snapshot."""
+    profiler = get_profiler()
+    if profiler:
+        profiler.video_done()
+
+
+def shutdown():
+    """Write the final profiles if profiling is on."""
+    if _profiler is not None:
+        _profiler.close()
@@ -0,0 +1,343 @@
+"""
+Local full-text and faceted search over archived video metadata.
+
+AirtableManager adds every record it writes to a SQLite FTS5 index, with
+hashtags and @mentions parsed out of descriptions into a facet table.
+Query it from the command line:
+
+    python search_index.py query "cooking" --hashtag recipe --uploader someone
+    python search_index.py facets --kind hashtag
+    python search_index.py reindex        # rebuild from Airtable
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from event_log import get_logger
+
+log = get_logger("SearchIndex")
+
+HASHTAG_PATTERN = re.compile(r"#(\w+)", re.UNICODE)
+MENTION_PATTERN = re.compile(r"@([\w.]+)", re.UNICODE)
+
+ARCHIVED_STATUS = "Downloaded"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    description TEXT,
+    uploader TEXT,
+    status TEXT,
+    source_url TEXT,
+    video_file TEXT,
+    drive_link TEXT,
+    archived_at TEXT
+);
+CREATE INDEX IF NOT EXISTS videos_uploader ON videos(uploader COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS videos_status ON videos(status);
+
+CREATE TABLE IF NOT EXISTS video_tags (
+    kind TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    PRIMARY KEY (kind, tag, video_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS video_tags_video ON video_tags(video_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+    description, uploader,
+    content='videos', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+# Keep the external-content FTS table in step with videos
+TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS videos_ai AFTER INSERT ON videos BEGIN
+        INSERT INTO videos_fts(rowid, description, uploader) VALUES (new.rowid, new.description, new.uploader);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS videos_ad AFTER DELETE ON videos BEGIN
+        INSERT INTO videos_fts(videos_fts, rowid, description, uploader)
+        VALUES ('delete', old.rowid, old.description, old.uploader);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS videos_au AFTER UPDATE OF description, uploader ON videos BEGIN
+        INSERT INTO videos_fts(videos_fts, rowid, description, uploader)
+        VALUES ('delete', old.rowid, old.description, old.uploader);
+        INSERT INTO videos_fts(rowid, description, uploader) VALUES (new.rowid, new.description, new.uploader);
+    END""",
+]
+
+DROP_TRIGGERS = ["DROP TRIGGER IF EXISTS videos_ai", "DROP TRIGGER IF EXISTS videos_ad",
+                 "DROP TRIGGER IF EXISTS videos_au"]
+
+UPSERT = """
+INSERT INTO videos (video_id, description, uploader, status, source_url, video_file, archived_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(video_id) DO UPDATE SET
+    description = COALESCE(excluded.description, videos.description),
+    uploader = COALESCE(excluded.uploader, videos.uploader),
+    -- A later failed retry must not hide an archived copy
+    status = CASE WHEN videos.status = 'Downloaded' THEN videos.status ELSE excluded.status END,
+    source_url = COALESCE(excluded.source_url, videos.source_url),
+    video_file = COALESCE(excluded.video_file, videos.video_file),
+    archived_at = COALESCE(excluded.archived_at, videos.archived_at)
+"""
+
+
+def parse_tags(description):
+    """Return (hashtags, mentions) found in a description, lower-cased and de-duplicated."""
+    if not description:
+        return [], []
+    hashtags = sorted({tag.lower() for tag in HASHTAG_PATTERN.findall(description)})
+    mentions = sorted({name.lower().rstrip(".") for name in MENTION_PATTERN.findall(description)})
+    return hashtags, mentions
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query of quoted prefix terms, so user input cannot break the syntax."""
+    terms = re.findall(r"\w+", text, re.UNICODE)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+class SearchIndex:
+    """SQLite FTS5 index of archived videos with hashtag and mention facets."""
+
+    def __init__(self, path):
+        """Open (or create) the index database."""
+        self.path = path
+        self.lock = threading.Lock()  # One connection shared by the worker threads
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        with self.conn:
+            for statement in TRIGGERS:
+                self.conn.execute(statement)
+
+    @classmethod
+    def from_env(cls):
+        """Open the index at SEARCH_INDEX_PATH, or return None if it is set to an empty value."""
+        path = os.getenv("SEARCH_INDEX_PATH", "archive_index.sqlite3")
+        return cls(path) if path else None
+
+    def add_video(self, video_id, description=None, uploader=None, status=None,
+                  source_url=None, video_file=None, archived_at=None):
+        """Insert or update one video and its facets."""
+        with self.lock, self.conn:
+            self._write_video(video_id, description, uploader, status, source_url, video_file, archived_at)
+
+    def set_drive_link(self, video_id, drive_link):
+        """Store the shared Drive link for a video."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE videos SET drive_link = ? WHERE video_id = ?", (drive_link, video_id))
+
+    def is_archived(self, video_id):
+        """True if the video was downloaded and its Drive upload confirmed (it has a shared link)."""
+        with self.lock:
+            row = self.conn.execute("SELECT status, drive_link FROM videos WHERE video_id = ?",
+                                    (video_id,)).fetchone()
+        return bool(row) and row["status"] == ARCHIVED_STATUS and row["drive_link"] is not None
+
+    def archived_count(self):
+        """Number of videos archived successfully, as is_archived() counts them."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM videos WHERE status = ? AND drive_link IS NOT NULL",
+                                     (ARCHIVED_STATUS,)).fetchone()[0]
+
+    def _write_video(self, video_id, description, uploader, status, source_url, video_file, archived_at):
+        """Upsert a video row and replace its tags. Caller must hold the lock and a transaction."""
+        self.conn.execute(UPSERT, (video_id, description, uploader, status, source_url, video_file, archived_at))
+        if description is not None:
+            hashtags, mentions = parse_tags(description)
+            self.conn.execute("DELETE FROM video_tags WHERE video_id = ?", (video_id,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO video_tags (kind, tag, video_id) VALUES (?, ?, ?)",
+                [("hashtag", tag, video_id) for tag in hashtags] + [("mention", name, video_id) for name in mentions],
+            )
+
+    def reindex(self, records):
+        """Replace the whole index with the given records in a single transaction.
+
+        records yields dicts with video_id, description, uploader, status,
+        source_url, video_file, drive_link and archived_at keys.
+        """
+        start_time = time.time()
+        latest = {}
+        for record in records:
+            video_id = record.get("video_id")
+            if not video_id:
+                continue
+            # Airtable may hold several records per video; keep the archived one, else the last
+            previous = latest.get(video_id)
+            if previous and previous.get("status") == ARCHIVED_STATUS and record.get("status") != ARCHIVED_STATUS:
+                continue
+            latest[video_id] = record
+
+        rows = []
+        tags = []
+        for video_id, record in latest.items():
+            rows.append((video_id, record.get("description"), record.get("uploader"), record.get("status"),
+                         record.get("source_url"), record.get("video_file"), record.get("drive_link"),
+                         record.get("archived_at")))
+            hashtags, mentions = parse_tags(record.get("description"))
+            tags.extend(("hashtag", tag, video_id) for tag in hashtags)
+            tags.extend(("mention", name, video_id) for name in mentions)
+
+        with self.lock:
+            try:
+                self.conn.execute("BEGIN")
+                # Per-row triggers are the slow part; rebuild the FTS table once instead
+                for statement in DROP_TRIGGERS:
+                    self.conn.execute(statement)
+                self.conn.execute("DELETE FROM videos")
+                self.conn.execute("DELETE FROM video_tags")
+                self.conn.executemany(
+                    "INSERT INTO videos (video_id, description, uploader, status, source_url,"
+                    " video_file, drive_link, archived_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.conn.executemany("INSERT OR IGNORE INTO video_tags (kind, tag, video_id) VALUES (?, ?, ?)", tags)
+                self.conn.execute("INSERT INTO videos_fts(videos_fts) VALUES ('rebuild')")
+                for statement in TRIGGERS:
+                    self.conn.execute(statement)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        elapsed = time.time() - start_time
+        log.info("reindexed", f"Reindexed {len(rows)} records in {elapsed:.2f}s",
+                 records=len(rows), seconds=round(elapsed, 3))
+        return len(rows)
+
+    def search(self, text=None, hashtags=(), mentions=(), uploader=None, status=None, limit=20):
+        """Return matching videos as dicts, best full-text matches first."""
+        select = ["v.video_id", "v.description", "v.uploader", "v.status", "v.source_url",
+                  "v.video_file", "v.drive_link", "v.archived_at"]
+        joins = []
+        where = []
+        params = []
+        order = "v.archived_at DESC"
+
+        if text and fts_query(text):
+            joins.append("JOIN videos_fts ON videos_fts.rowid = v.rowid")
+            where.append("videos_fts MATCH ?")
+            params.append(fts_query(text))
+            select.append("snippet(videos_fts, 0, '[', ']', '...', 12) AS snippet")
+            order = "bm25(videos_fts)"
+        for kind, values in (("hashtag", hashtags), ("mention", mentions)):
+            for value in values:
+                where.append("v.video_id IN (SELECT video_id FROM video_tags WHERE kind = ? AND tag = ?)")
+                params.extend([kind, value.lstrip("#@").lower()])
+        if uploader:
+            where.append("v.uploader = ? COLLATE NOCASE")
+            params.append(uploader.lstrip("@"))
+        if status:
+            where.append("v.status = ?")
+            params.append(status)
+
+        sql = f"SELECT {', '.join(select)} FROM videos v {' '.join(joins)}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def facets(self, kind="hashtag", limit=20):
+        """Return the most common hashtags, mentions or uploaders with counts."""
+        with self.lock:
+            if kind == "uploader":
+                rows = self.conn.execute(
+                    "SELECT uploader AS value, COUNT(*) AS count FROM videos WHERE uploader IS NOT NULL"
+                    " GROUP BY uploader COLLATE NOCASE ORDER BY count DESC LIMIT ?", (limit,))
+            else:
+                rows = self.conn.execute(
+                    "SELECT tag AS value, COUNT(*) AS count FROM video_tags WHERE kind = ?"
+                    " GROUP BY tag ORDER BY count DESC LIMIT ?", (kind, limit))
+            return [dict(row) for row in rows]
+
+    def close(self):
+        """Close the database."""
+        with self.lock:
+            self.conn.close()
+
+
+def airtable_records():
+    """Yield index records for every row in the configured Airtable table."""
+    from pyairtable import Table
+
+    table = Table(os.getenv("AIRTABLE_ACCESS_TOKEN_VALUE"), os.getenv("AIRTABLE_BASE_ID"),
+                  os.getenv("AIRTABLE_TABLE_NAME"))
+    for page in table.iterate(page_size=100):
+        for record in page:
+            fields = record.get("fields", {})
+            attachments = fields.get("Video File") or []
+            yield {
+                "video_id": fields.get("Video Id"),
+                "description": fields.get("Description"),
+                "uploader": fields.get("Uploader"),
+                "status": fields.get("Status"),
+                "source_url": fields.get("Source Url"),
+                "drive_link": attachments[0].get("url") if attachments else None,
+                "archived_at": fields.get("Date Uploaded"),
+            }
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Search the local archive index")
+    parser.add_argument("--index", help="Index path (default: SEARCH_INDEX_PATH or archive_index.sqlite3)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="Full-text and faceted search")
+    query_parser.add_argument("text", nargs="?", help="Words to match in descriptions and uploader names")
+    query_parser.add_argument("--hashtag", action="append", default=[], help="Require a hashtag (repeatable)")
+    query_parser.add_argument("--mention", action="append", default=[], help="Require an @mention (repeatable)")
+    query_parser.add_argument("--uploader", help="Only videos from this uploader")
+    query_parser.add_argument("--status", help="Only records with this status, e.g. Downloaded")
+    query_parser.add_argument("--limit", type=int, default=20)
+    query_parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    facets_parser = subparsers.add_parser("facets", help="Most common hashtags, mentions or uploaders")
+    facets_parser.add_argument("--kind", choices=["hashtag", "mention", "uploader"], default="hashtag")
+    facets_parser.add_argument("--limit", type=int, default=20)
+
+    subparsers.add_parser("reindex", help="Rebuild the index from Airtable")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    index = SearchIndex(args.index or os.getenv("SEARCH_INDEX_PATH") or "archive_index.sqlite3")
+
+    start_time = time.perf_counter()
+    if args.command == "query":
+        results = index.search(args.text, args.hashtag, args.mention, args.uploader, args.status, args.limit)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        if args.json:
+            print(json.dumps({"results": results, "elapsed_ms": round(elapsed_ms, 2)}, indent=2))
+        else:
+            for row in results:
+                text = row.get("snippet") or (row["description"] or "")[:80]
+                print(f"{row['video_id']}  @{row['uploader'] or '?'}  [{row['status']}]  {text}")
+            print(f"{len(results)} result(s) in {elapsed_ms:.1f} ms")
+    elif args.command == "facets":
+        for row in index.facets(args.kind, args.limit):
+            print(f"{row['count']:>7}  {row['value']}")
+    elif args.command == "reindex":
+        count = index.reindex(airtable_records())
+        print(f"Reindexed {count} records in {time.perf_counter() - start_time:.2f}s")
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
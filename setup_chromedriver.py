@@ -1,56 +1,116 @@
 import os
+import platform
 import requests
+import shutil
 import zipfile
 import sys
 from io import BytesIO
 
+# Chrome for Testing platform names and the driver binary inside each zip
+DRIVER_PLATFORMS = {
+    "Windows": ("win64", "chromedriver.exe"),
+    "Linux": ("linux64", "chromedriver"),
+    "Darwin": ("mac-x64", "chromedriver"),
+}
+
+LINUX_CHROME_NAMES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser"]
+
 def download_chromedriver():
     # Chrome version 131.0.6778.265 needs ChromeDriver 131.0.6778.264
     version = "131.0.6778.264"
     print(f"Downloading ChromeDriver version {version}...")
-    
+
+    platform_name, driver_name = DRIVER_PLATFORMS.get(platform.system(), DRIVER_PLATFORMS["Windows"])
+
     # URL for the ChromeDriver download
-    url = f"https://edgedl.me.gvt1.com/edgedl/chrome/chrome-for-testing/{version}/win64/chromedriver-win64.zip"
-    
+    url = f"https://edgedl.me.gvt1.com/edgedl/chrome/chrome-for-testing/{version}/{platform_name}/chromedriver-{platform_name}.zip"
+
     try:
         # Download the zip file
         response = requests.get(url)
         response.raise_for_status()
-        
+
         # Create chromedriver directory if it doesn't exist
         if not os.path.exists('chromedriver'):
             os.makedirs('chromedriver')
-        
+
         # Extract the zip file
         with zipfile.ZipFile(BytesIO(response.content)) as zip_ref:
             zip_ref.extractall('chromedriver')
-        
-        # The chromedriver.exe will be in a subdirectory, let's move it up
-        chromedriver_dir = os.path.join('chromedriver', 'chromedriver-win64')
+
+        # The chromedriver binary will be in a subdirectory, let's move it up
+        chromedriver_dir = os.path.join('chromedriver', f'chromedriver-{platform_name}')
         if os.path.exists(chromedriver_dir):
-            os.rename(
-                os.path.join(chromedriver_dir, 'chromedriver.exe'),
-                os.path.join('chromedriver', 'chromedriver.exe')
+            os.replace(
+                os.path.join(chromedriver_dir, driver_name),
+                os.path.join('chromedriver', driver_name)
             )
-        
+        driver_path = os.path.join('chromedriver', driver_name)
+        if platform.system() != "Windows":
+            os.chmod(driver_path, 0o755)
+
         print("ChromeDriver downloaded and extracted successfully!")
-        print(f"ChromeDriver location: {os.path.abspath(os.path.join('chromedriver', 'chromedriver.exe'))}")
-        
+        print(f"ChromeDriver location: {os.path.abspath(driver_path)}")
+
     except Exception as e:
         print(f"Error downloading ChromeDriver: {str(e)}")
         sys.exit(1)
 
 def get_chrome_path():
     """Get the path to Chrome executable"""
-    chrome_path = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
-    if not os.path.exists(chrome_path):
-        raise Exception("Chrome not found in default location!")
-    return chrome_path
+    chrome_path = os.getenv("CHROME_PATH")
+    if chrome_path:
+        if not os.path.exists(chrome_path):
+            raise Exception(f"CHROME_PATH does not exist: {chrome_path}")
+        return chrome_path
+
+    system = platform.system()
+    if system == "Windows":
+        candidates = [
+            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Google', 'Chrome', 'Application', 'chrome.exe'),
+        ]
+    elif system == "Darwin":
+        candidates = ["/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"]
+    else:
+        candidates = [shutil.which(name) for name in LINUX_CHROME_NAMES]
+        candidates += ["/snap/bin/chromium"]
+
+    for chrome_path in candidates:
+        if chrome_path and os.path.exists(chrome_path):
+            return chrome_path
+    raise Exception("Chrome not found in default location! Set CHROME_PATH in your .env file.")
 
-def get_user_data_dir():
+def get_user_data_dir(chrome_path=None):
     """Get the Chrome user data directory"""
-    user_data_dir = os.path.join(os.environ['LOCALAPPDATA'], 'Google', 'Chrome', 'User Data')
+    user_data_dir = os.getenv("CHROME_USER_DATA_DIR")
+    if user_data_dir:
+        return os.path.normpath(os.path.expanduser(user_data_dir))
+
+    system = platform.system()
+    if system == "Windows":
+        user_data_dir = os.path.join(os.environ['LOCALAPPDATA'], 'Google', 'Chrome', 'User Data')
+    elif system == "Darwin":
+        user_data_dir = os.path.expanduser("~/Library/Application Support/Google/Chrome")
+    else:
+        # Chromium keeps its profile separately from Google Chrome
+        config_dir = os.getenv("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+        is_chromium = chrome_path and "chromium" in os.path.basename(chrome_path)
+        user_data_dir = os.path.join(config_dir, 'chromium' if is_chromium else 'google-chrome')
     return os.path.normpath(user_data_dir)
 
+def get_chromedriver_path():
+    """Get the path to a local chromedriver, or None to let undetected-chromedriver fetch one"""
+    driver_path = os.getenv("CHROMEDRIVER_PATH")
+    if driver_path:
+        return driver_path
+
+    driver_name = "chromedriver.exe" if platform.system() == "Windows" else "chromedriver"
+    local_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chromedriver', driver_name)
+    if os.path.exists(local_path):
+        return local_path
+    return shutil.which(driver_name)
+
 if __name__ == "__main__":
     download_chromedriver()
@@ -0,0 +1,156 @@
+"""
+Concurrent cover-image prefetch for archived videos (opt-in with THUMBNAILS=1).
+
+When a video page is read, its cover image URL is handed to a small thread
+pool that downloads it over pooled HTTP connections while the video itself
+downloads. The video's file name is not known until its download finishes, so
+images land in DOWNLOAD_DIR/thumbnails named by their SHA-256 first and are
+then linked next to the video as <video name>.<ext>. A cover shared by several
+videos is stored once and uploaded to Drive only once.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from event_log import get_logger
+
+log = get_logger("ThumbnailFetcher")
+
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/avif": ".avif"}
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/131.0.0.0 Safari/537.36",
+    "Referer": "https://www.tiktok.com/",
+}
+
+
+class ThumbnailFetcher:
+    """Thread pool that fetches cover images into a content-addressed directory."""
+
+    def __init__(self, directory, workers=4, timeout=15.0):
+        """Create the thumbnail directory, HTTP session and worker pool."""
+        self.directory = directory
+        self.timeout = timeout
+        os.makedirs(directory, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(REQUEST_HEADERS)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+
+        self.lock = threading.Lock()
+        self.futures = {}  # video_id -> Future resolving to the local path or None
+        self.links_path = os.path.join(directory, "drive_links.json")
+        self.links = self._load_links()  # content hash -> shared Drive link
+        self.stats = {"fetched": 0, "deduplicated": 0, "failed": 0, "bytes": 0}
+
+    @classmethod
+    def from_env(cls):
+        """Build a fetcher in DOWNLOAD_DIR/thumbnails; None unless THUMBNAILS=1 and DOWNLOAD_DIR is set."""
+        download_dir = os.getenv("DOWNLOAD_DIR")
+        if not download_dir or os.getenv("THUMBNAILS", "0") != "1":
+            return None
+        return cls(os.path.join(download_dir, "thumbnails"),
+                   workers=int(os.getenv("THUMBNAIL_WORKERS", "4")))
+
+    def prefetch(self, video_id, cover_url):
+        """Start fetching a video's cover image in the background."""
+        if not cover_url:
+            return
+        with self.lock:
+            if video_id not in self.futures:
+                self.futures[video_id] = self.executor.submit(self._fetch, video_id, cover_url)
+
+    def result(self, video_id, timeout=10.0):
+        """Return the local path of a prefetched cover, waiting up to timeout; None if unavailable."""
+        with self.lock:
+            future = self.futures.pop(video_id, None)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            log.debug("thumbnail_unavailable", video_id=video_id, error=str(e) or type(e).__name__)
+            return None
+
+    def place_beside(self, path, video_file):
+        """Link (or copy) a stored thumbnail next to its video as <video name>.<ext> and return that path."""
+        target = os.path.splitext(video_file)[0] + os.path.splitext(path)[1]
+        if not os.path.exists(target):
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)  # Different file system, or no hard links
+        return target
+
+    def content_hash(self, path):
+        """The SHA-256 a thumbnail is stored under."""
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def drive_link(self, path):
+        """Return the Drive link of an already uploaded copy of this image, or None."""
+        with self.lock:
+            return self.links.get(self.content_hash(path))
+
+    def remember_link(self, path, link):
+        """Record the Drive link for an image so identical covers are not uploaded again."""
+        with self.lock:
+            self.links[self.content_hash(path)] = link
+            try:
+                tmp_path = self.links_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.links, f)
+                os.replace(tmp_path, self.links_path)
+            except OSError as e:
+                log.warning("thumbnail_links_error", f"Could not save thumbnail links: {str(e)}")
+
+    def _load_links(self):
+        """Load the content hash -> Drive link map saved by earlier runs."""
+        try:
+            with open(self.links_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def close(self):
+        """Finish outstanding fetches and release connections."""
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        log.debug("thumbnails_closed", **self.stats)
+
+    def _fetch(self, video_id, cover_url):
+        """Download one cover image and store it under its content hash."""
+        try:
+            response = self.session.get(cover_url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            with self.lock:
+                self.stats["failed"] += 1
+            log.debug("thumbnail_failed", video_id=video_id, error=str(e))
+            return None
+
+        content = response.content
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        digest = hashlib.sha256(content).hexdigest()
+        path = os.path.join(self.directory, digest + EXTENSIONS.get(content_type, ".jpg"))
+        deduplicated = os.path.exists(path)
+        if not deduplicated:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.stats["deduplicated" if deduplicated else "fetched"] += 1
+            self.stats["bytes"] += len(content)
+        log.debug("thumbnail_fetched", video_id=video_id, path=path, bytes=len(content),
+                  deduplicated=deduplicated)
+        return path
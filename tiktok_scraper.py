@@ -7,11 +7,35 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
 from watchdog.observers import Observer
+import base64
+import json
 import os
+import requests
 import time
 from file_handlers import DownloadHandler
+from concurrency_controller import ConcurrencyController
+from download_scheduler import DownloadScheduler
+from event_log import get_logger
+from fixture_corpus import FixtureRecorder
+from metadata_cache import MetadataCache
+from page_extractors import (DESCRIPTION_SELECTOR, UPLOADER_SELECTOR, MENU_ITEM_SELECTOR,
+                             FAVORITE_TILE_SELECTOR, FAVORITES_API_PATH, parse_video_url,
+                             extract_media_info, extract_item_list_durations)
 import threading
+import bandwidth
+from profiling import profiled
+import profiling
+
+log = get_logger("TikTokScraper")
+
+class DownloadFailure(Exception):
+    """A download attempt failed for a reason the concurrency controller can act on."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
 
 class TikTokScraper:
     """Handles TikTok-specific scraping operations."""
@@ -22,57 +46,87 @@ class TikTokScraper:
         self.airtable_manager = airtable_manager
         self.download_dir = os.getenv("DOWNLOAD_DIR")
         self.download_thread = None
+        self.dispatch_thread = None
         self.favorites_window = None  # Store handle to favorites window
+        self.driver_lock = threading.RLock()  # WebDriver is not thread-safe
+        self.controller = ConcurrencyController.from_env()
+        self.download_limiter = bandwidth.download_limiter()
+        self.fixture_recorder = FixtureRecorder.from_env()
+        self.metadata_cache = MetadataCache.from_env()
+        self.http = requests.Session()  # Pooled connections for direct media fetches
+        self.download_queue = DownloadScheduler.from_env(self.metadata_cache)
+        self.supervisor = None  # Optional BrowserSupervisor
+        self.generation = 0  # Bumped whenever the driver is replaced
+        self.driver_ready = threading.Event()  # Cleared while the supervisor replaces the driver
+        self.driver_ready.set()
+        self.seen_urls = set()  # URLs queued this session, re-marked after a restart
+        self.restart_requeues = set()  # URLs already retried once after a browser restart
+        self.item_list_requests = set()  # Favorites API responses waiting to be read for durations
+        # incremental: queue favorites newer than the last archived ones without any clicks
+        self.sync_mode = os.getenv("FAVORITES_SYNC", "off").lower()
+        self.sync_stop_after = int(os.getenv("FAVORITES_SYNC_STOP_AFTER", "5"))
+        self.sync_exit = os.getenv("FAVORITES_SYNC_EXIT", "0") == "1"  # Exit once the sync is downloaded
+
+    def begin_restart(self):
+        """Mark the driver as being replaced, before it is killed.
+
+        Work interrupted by the restart sees a new generation and is retried
+        rather than failed; new work waits on driver_ready until it is back.
+        """
+        self.driver_ready.clear()
+        self.generation += 1
+
+    def attach_driver(self, driver):
+        """Switch to a new WebDriver after a browser restart."""
+        self.driver = driver
+        self.generation += 1
+
+    def restore_session(self):
+        """Reopen the favorites page after a browser restart. Caller must hold driver_lock."""
+        if self.favorites_window is None:
+            return  # Batch mode has no page to restore
+        self.favorites_window = None
+        if self.open_favorites(max_wait=60):
+            self.add_download_buttons()
         
     def extract_video_id(self, url):
         """Extract the video ID from a TikTok URL."""
         try:
-            # Try to get video ID from URL
-            if "/video/" in url:
-                video_id = url.split("/video/")[1].split("?")[0]
-                return video_id
-            return None
+            return parse_video_url(url)[0]
         except Exception as e:
-            print(f"Error extracting video ID: {str(e)}")
+            log.warning("video_id_error", f"Error extracting video ID: {str(e)}", url=url)
             return None
             
     def get_video_description(self):
         """Get the description of the current video."""
         try:
             # Wait for the content to load
-            print("Waiting for content to load...")
             time.sleep(3)  # Give the page time to load
             
             # Try to find the description span
-            print("Looking for description span...")
-            desc_span = self.driver.find_element(By.CSS_SELECTOR, "span.css-j2a19r-SpanText")
+            desc_span = self.driver.find_element(By.CSS_SELECTOR, DESCRIPTION_SELECTOR)
             description = desc_span.text.strip()
             
             if description:
-                print(f"Description found: {description[:50]}...")
+                log.debug("description_found", description=description[:50])
                 return description
             else:
-                print("No description found in span")
+                log.debug("description_empty", "No description found in span")
                 return None
                 
         except Exception as e:
-            print(f"Error getting description: {str(e)}")
-            print("Page source around description:")
-            try:
-                body = self.driver.find_element(By.TAG_NAME, "body")
-                print(body.get_attribute('innerHTML')[:1000])
-            except:
-                print("Could not get page source")
+            # Capture pages with FIXTURE_CAPTURE_PATH to inspect the markup offline
+            log.debug("description_missing", f"Error getting description: {str(e)}", url=self.driver.current_url)
             return None
             
     def get_uploader_info(self):
         """Get the uploader's information."""
         try:
             # Try to find uploader info
-            uploader_element = self.driver.find_element(By.CSS_SELECTOR, "h3[data-e2e='browse-username']")
+            uploader_element = self.driver.find_element(By.CSS_SELECTOR, UPLOADER_SELECTOR)
             return uploader_element.text.strip()
         except Exception as e:
-            print(f"Error getting uploader info: {str(e)}")
+            log.debug("uploader_missing", f"Error getting uploader info: {str(e)}")
             return None
             
     def click_download_button(self):
@@ -81,12 +135,37 @@ class TikTokScraper:
             # Find and click download button
             download_button = self.driver.find_element(By.CSS_SELECTOR, "button[data-e2e='download-icon']")
             download_button.click()
-            print("Clicked download button")
+            log.debug("download_clicked", "Clicked download button")
             return True
         except Exception as e:
-            print(f"Error clicking download button: {str(e)}")
+            log.debug("download_button_missing", f"Error clicking download button: {str(e)}")
             return False
             
+    def click_context_menu_download(self, video=None):
+        """Right click the video and choose "Download video" from the context menu."""
+        try:
+            if video is None:
+                video = self.driver.find_element(By.TAG_NAME, "video")
+            ActionChains(self.driver).context_click(video).perform()
+            time.sleep(1)  # Wait for context menu
+
+            # Find the Download video option
+            try:
+                menu_items = WebDriverWait(self.driver, 5).until(
+                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, MENU_ITEM_SELECTOR))
+                )
+            except TimeoutException:
+                menu_items = []
+            for item in menu_items:
+                if item.text.strip().lower() == "download video":
+                    item.click()
+                    log.debug("download_clicked", "Clicked Download video in context menu")
+                    return True
+            return False
+        except Exception as e:
+            log.warning("context_menu_error", f"Error using context menu: {str(e)}")
+            return False
+
     def start_download_handler(self, video_id, source_url):
         """Start monitoring for downloaded video file."""
         try:
@@ -95,155 +174,384 @@ class TikTokScraper:
             observer = Observer()
             observer.schedule(handler, self.download_dir, recursive=False)
             observer.start()
-            print(f"Started file monitoring in {self.download_dir}")
+            log.debug("monitor_started", video_id=video_id, directory=self.download_dir)
             
             return handler, observer
             
         except Exception as e:
-            print(f"Error setting up download handler: {str(e)}")
+            log.error("monitor_error", f"Error setting up download handler: {str(e)}", video_id=video_id)
             return None, None
             
+    @profiled("check_for_downloads")
     def check_for_downloads(self, handler, observer, timeout=30):
         """Check for downloaded files with timeout."""
         try:
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                if handler.found_file:
-                    print(f"Found downloaded file: {handler.found_file}")
-                    return handler.found_file
-                time.sleep(1)
+            if handler.found_event.wait(timeout):
+                log.debug("download_found", video_id=handler.video_id, file=handler.found_file)
+                return handler.found_file
                 
-            print(f"Timeout waiting for download after {timeout} seconds")
+            log.warning("download_timeout", f"Timeout waiting for download after {timeout} seconds",
+                        video_id=handler.video_id)
             return None
             
         finally:
             observer.stop()
             observer.join()
             
+    @profiled("download_video")
     def download_video(self, url):
         """Download a video from the given URL."""
+        vlog = log.bind(video_id=self.extract_video_id(url))
         try:
-            print(f"\nProcessing video URL: {url}")
+            vlog.info("video_started", f"Processing video URL: {url}", url=url)
             
-            # Navigate to video page
+            # A retry can often skip the page: reuse the file or the cached media URL
+            video_id = self.extract_video_id(url)
+            cached = self.download_from_cache(video_id) if video_id else None
+            if cached:
+                description, uploader, downloaded_file = cached
+                uploader = uploader or parse_video_url(url)[1]
+            else:
+                downloaded = self.download_video_page(url, vlog)
+                if not downloaded:
+                    return False
+                video_id, description, uploader, downloaded_file, page_load, elapsed = downloaded
+                
+            # Create Airtable record
+            record = self.airtable_manager.create_record(video_id, description, uploader,
+                                                         video_file=downloaded_file, source_url=url)
+            if not record:
+                vlog.warning("video_failed", "Could not create Airtable record", reason="record_error")
+                return False
+            if not cached:
+                self.controller.record_success(page_load, os.path.getsize(downloaded_file) / elapsed)
+            vlog.info("video_archived", f"Archived {os.path.basename(downloaded_file)}", file=downloaded_file)
+            return True
+            
+        except Exception as e:
+            vlog.error("video_failed", f"Error downloading video: {str(e)}", reason="error")
+            return False
+
+    def download_video_page(self, url, vlog):
+        """Open the video page and download it with the page's own controls.
+
+        Returns (video_id, description, uploader, file, page_load, elapsed), or
+        None after logging why the video failed.
+        """
+        self.driver_ready.wait()
+        generation = self.generation
+        with self.driver_lock:
+            # Navigate to video page, paced by the concurrency controller and bandwidth limit
+            self.controller.wait_for_navigation()
+            self.wait_for_bandwidth()
+            self.apply_download_throttle()
+            start_time = time.time()
             self.driver.get(url)
-            time.sleep(3)  # Wait for page load
+            try:
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "video"))
+                )
+            except TimeoutException:
+                vlog.warning("video_failed", "Video element did not load", reason="page_load_timeout")
+                if self.generation == generation:
+                    self.controller.record_failure("page_load_timeout")
+                return None
+            page_load = time.time() - start_time
             
             # Get video information
             video_id = self.extract_video_id(url)
             if not video_id:
-                print("Could not extract video ID")
-                return False
+                vlog.warning("video_failed", "Could not extract video ID", reason="bad_url")
+                return None
                 
             description = self.get_video_description()
-            uploader = self.get_uploader_info()
+            uploader = self.get_uploader_info() or parse_video_url(url)[1]
+            self.read_page_metadata(url, video_id, description, uploader)
             
             # Start monitoring for downloads
             handler, observer = self.start_download_handler(video_id, url)
             if not handler or not observer:
-                return False
+                vlog.warning("video_failed", "Could not monitor download directory", reason="monitor_error")
+                return None
                 
-            # Click download button
-            if not self.click_download_button():
+            # Click download button, falling back to the context menu
+            if not self.click_download_button() and not self.click_context_menu_download():
                 observer.stop()
                 observer.join()
-                return False
+                vlog.warning("video_failed", "Download button not found", reason="download_option_missing")
+                if self.generation == generation:
+                    self.controller.record_failure("download_option_missing")
+                return None
                 
             # Wait for download
+            click_time = time.time()
             downloaded_file = self.check_for_downloads(handler, observer)
             if not downloaded_file:
-                print("Download failed or timed out")
-                self.airtable_manager.create_record(video_id, description, uploader, status="Failed")
-                return False
+                vlog.warning("video_failed", "Download failed or timed out", reason="download_timeout")
+                # A restart mid-download is not TikTok pushing back, and the caller retries it
+                if self.generation == generation:
+                    self.controller.record_failure("download_timeout")
+                    self.airtable_manager.create_record(video_id, description, uploader, status="Failed",
+                                                        source_url=url)
+                return None
+            elapsed = max(time.time() - click_time, 0.001)
+            self.record_download_bytes(downloaded_file, click_time)
+            if self.metadata_cache:
+                self.metadata_cache.put(video_id, video_file=downloaded_file)
+            return video_id, description, uploader, downloaded_file, page_load, elapsed
+
+    def open_favorites(self, max_wait=120):
+        """Open the profile page, wait for login and switch to the Favorites tab."""
+        # Navigate to your profile page first
+        log.info("profile_opening", "Navigating to your profile page...")
+        tiktok_username = os.getenv("TIKTOK_USERNAME")
+        if not tiktok_username:
+            log.error("config_error", "TIKTOK_USERNAME not set in .env file!")
+            return False
+            
+        self.driver.get(f'https://www.tiktok.com/@{tiktok_username}')
+        time.sleep(3)
+        
+        # Wait for user to log in
+        log.info("login_waiting", "Please log in using the QR code. Waiting for login to complete...")
+        
+        # Wait for the favorites tab to appear (indicates successful login)
+        start_time = time.time()
+        favorites_found = False
+        
+        while time.time() - start_time < max_wait:
+            try:
+                # Try to find the favorites element
+                favorites = self.driver.find_element(By.XPATH, "//*[contains(text(), 'Favorites')]")
+                if favorites.is_displayed():
+                    favorites_found = True
+                    log.info("login_succeeded", "Login successful!")
+                    break
+            except:
+                time.sleep(2)  # Check every 2 seconds
                 
-            # Create Airtable record
-            self.airtable_manager.create_record(video_id, description, uploader, video_file=downloaded_file)
-            return True
+        if not favorites_found:
+            log.error("login_timeout", "Login timeout. Please run the script again and try to log in faster.")
+            return False
             
+        # Give a moment for the page to settle
+        time.sleep(3)
+        
+        # Click on Favorites tab
+        try:
+            favorites.click()
+            log.info("favorites_opened", "Opened favorites tab")
+            self.favorites_window = self.driver.current_window_handle
         except Exception as e:
-            print(f"Error downloading video: {str(e)}")
+            log.error("favorites_error", f"Error clicking favorites: {str(e)}")
             return False
             
+        time.sleep(5)
+        return True
+            
     def browse_favorites(self):
         """Browse and interact with favorite videos."""
         try:
-            # Navigate to your profile page first
-            print("\nNavigating to your profile page...")
-            tiktok_username = os.getenv("TIKTOK_USERNAME")
-            if not tiktok_username:
-                print("ERROR: TIKTOK_USERNAME not set in .env file!")
-                return
-                
-            self.driver.get(f'https://www.tiktok.com/@{tiktok_username}')
-            time.sleep(3)
-            
-            # Wait for user to log in
-            print("\nPlease log in using the QR code...")
-            print("Waiting for login to complete...")
-            
-            # Wait for the favorites tab to appear (indicates successful login)
-            max_wait = 120  # Wait up to 2 minutes for login
-            start_time = time.time()
-            favorites_found = False
-            
-            while time.time() - start_time < max_wait:
-                try:
-                    # Try to find the favorites element
-                    favorites = self.driver.find_element(By.XPATH, "//*[contains(text(), 'Favorites')]")
-                    if favorites.is_displayed():
-                        favorites_found = True
-                        print("\nLogin successful!")
-                        break
-                except:
-                    time.sleep(2)  # Check every 2 seconds
-                    
-            if not favorites_found:
-                print("\nLogin timeout. Please run the script again and try to log in faster.")
+            if not self.open_favorites():
                 return
                 
-            # Give a moment for the page to settle
-            time.sleep(3)
-            
-            # Click on Favorites tab
-            print("\nNavigating to favorites...")
-            try:
-                favorites.click()
-                print("Clicked favorites tab!")
-                self.favorites_window = self.driver.current_window_handle
-            except Exception as e:
-                print(f"Error clicking favorites: {str(e)}")
-                return
-                
-            time.sleep(5)
-            
             # Add download buttons and setup handlers
-            print("\nSetting up interactive download buttons...")
             self.add_download_buttons()
             self.setup_download_handler()
             
-            print("\nReady! Click the download buttons on the videos you want to save.")
-            print("Close the browser window when you're done.")
+            if not self.sync_exit:
+                log.info("ready", "Ready! Click the download buttons on the videos you want to save. "
+                                  "Close the browser window when you're done.")
+            if self.supervisor:
+                self.supervisor.start()
+            if self.sync_mode == "incremental":
+                self.sync_new_favorites()
             
             # Keep the script running until the browser is closed
-            try:
-                while True:
-                    self.driver.current_url  # Check if browser is still open
-                    time.sleep(1)
-            except:
-                print("\nBrowser closed. Exiting...")
+            if self.sync_exit:
+                self.wait_for_downloads()
+            elif self.supervisor:
+                self.supervisor.closed.wait()
+            else:
+                try:
+                    while True:
+                        self.driver.current_url  # Check if browser is still open
+                        time.sleep(1)
+                except:
+                    pass
+            schedule = self.download_queue.summary()
+            if schedule["archived"]:
+                log.info("schedule_summary",
+                         f"Policy {schedule['policy']}: {schedule['archived']} archived, time from queue to archive "
+                         f"mean {schedule['mean_seconds']:.0f}s, p95 {schedule['p95_seconds']:.0f}s", **schedule)
+            log.info("browser_closed", "Sync complete. Exiting..." if self.sync_exit else "Browser closed. Exiting...",
+                     concurrency=self.controller.summary(),
+                     supervisor=self.supervisor.stats if self.supervisor else None,
+                     bandwidth=bandwidth.report(),
+                     page_cache=self.metadata_cache.stats if self.metadata_cache else None)
+            if self.fixture_recorder:
+                self.fixture_recorder.close()
             
         except Exception as e:
-            print(f"\nError: {str(e)}")
+            log.error("browse_error", f"Error: {str(e)}")
             
+    def sync_new_favorites(self):
+        """Queue favorites that are not archived yet, newest first.
+
+        Walks the favorites tiles top to bottom, scrolling to load more, and
+        stops after sync_stop_after archived videos in a row: everything below
+        them was archived by an earlier sync.
+        """
+        search_index = self.airtable_manager.search_index
+        if not search_index:
+            log.warning("sync_unavailable", "Incremental sync needs the search index (SEARCH_INDEX_PATH)")
+            return
+        start_time = time.time()
+        scanned = queued = archived_in_a_row = 0
+        reached_end = False
+        while archived_in_a_row < self.sync_stop_after:
+            with self.driver_lock:
+                self.read_favorite_durations()
+                links = self.driver.execute_script(
+                    "return Array.from(document.querySelectorAll(arguments[0]))"
+                    ".map(t => t.querySelector('a')?.href || null);",
+                    FAVORITE_TILE_SELECTOR,
+                )
+            if len(links) <= scanned:
+                if not self.load_more_favorites(len(links)):
+                    reached_end = True
+                    break
+                continue
+
+            new_urls = []
+            for tile_index in range(scanned, len(links)):
+                scanned += 1
+                url = links[tile_index]
+                video_id = parse_video_url(url)[0]
+                if not video_id:
+                    continue
+                if url in self.seen_urls or search_index.is_archived(video_id):
+                    archived_in_a_row += 1
+                    if archived_in_a_row >= self.sync_stop_after:
+                        break
+                    continue
+                archived_in_a_row = 0
+                self.seen_urls.add(url)
+                new_urls.append(url)
+                log.debug("video_queued", f"Queued {url}", video_id=video_id, url=url, tile_index=tile_index,
+                          source="sync")
+                self.download_queue.put(url, tile_index=tile_index)
+            queued += len(new_urls)
+            if new_urls:
+                self.mark_queued(new_urls)
+
+        elapsed = time.time() - start_time
+        # Without the sync every favorite would have to be loaded: at least all archived ones plus the new ones
+        full_scan_tiles = scanned if reached_end else max(scanned, search_index.archived_count() + queued)
+        saved = elapsed / max(scanned, 1) * (full_scan_tiles - scanned)
+        log.info("favorites_synced",
+                 f"Sync scanned {scanned} tiles and queued {queued} new videos in {elapsed:.1f}s"
+                 + (f"; a full scan of ~{full_scan_tiles} tiles would take ~{saved + elapsed:.0f}s" if saved else ""),
+                 tiles_scanned=scanned, queued=queued, seconds=round(elapsed, 1), reached_end=reached_end,
+                 full_scan_tiles=full_scan_tiles, seconds_saved=round(saved, 1))
+        return queued
+
+    def read_favorite_durations(self):
+        """Pass video lengths from the favorites API responses to the shortest-first scheduler.
+
+        Reads the Chrome performance log (enabled by BrowserManager for that
+        policy) for item_list responses and fetches their bodies over CDP.
+        Caller must hold driver_lock.
+        """
+        if self.download_queue.policy != "shortest":
+            return
+        try:
+            entries = self.driver.get_log("performance")
+        except Exception as e:
+            log.debug("performance_log_error", error=str(e))
+            return
+        finished = set()
+        for entry in entries:
+            try:
+                message = json.loads(entry["message"])["message"]
+            except (KeyError, TypeError, ValueError):
+                continue
+            params = message.get("params", {})
+            if message.get("method") == "Network.responseReceived" and \
+                    FAVORITES_API_PATH in params.get("response", {}).get("url", ""):
+                self.item_list_requests.add(params["requestId"])
+            elif message.get("method") == "Network.loadingFinished":
+                finished.add(params.get("requestId"))
+
+        for request_id in self.item_list_requests & finished:
+            self.item_list_requests.discard(request_id)
+            try:
+                response = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+                body = response["body"]
+                if response.get("base64Encoded"):
+                    body = base64.b64decode(body).decode("utf-8")
+                durations = extract_item_list_durations(json.loads(body))
+            except Exception as e:
+                log.debug("favorites_api_error", request_id=request_id, error=str(e))
+                continue
+            self.download_queue.note_durations(durations)
+            log.debug("favorite_durations", count=len(durations))
+
+    def load_more_favorites(self, tile_count, timeout=10):
+        """Scroll to the last favorites tile; True once more tiles have loaded."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.driver_lock:
+                count = self.driver.execute_script(
+                    "const tiles = document.querySelectorAll(arguments[0]);"
+                    "if (tiles.length) tiles[tiles.length - 1].scrollIntoView();"
+                    "return tiles.length;",
+                    FAVORITE_TILE_SELECTOR,
+                )
+            if count > tile_count:
+                return True
+            time.sleep(1)
+        return False
+
+    def mark_queued(self, urls):
+        """Show videos queued without a click as Queued on the favorites page."""
+        try:
+            with self.driver_lock:
+                self.driver.execute_script(
+                    "window.queuedUrls = window.queuedUrls || new Set();"
+                    "arguments[0].forEach(url => window.queuedUrls.add(url));"
+                    "document.querySelectorAll('.download-btn').forEach(btn => {"
+                    "  if (window.queuedUrls.has(btn.getAttribute('data-video-url'))) {"
+                    "    btn.classList.add('downloaded'); btn.textContent = 'Queued';"
+                    "  }"
+                    "});",
+                    urls,
+                )
+        except Exception as e:
+            log.debug("mark_queued_error", error=str(e))
+
+    def wait_for_downloads(self):
+        """Block until no video is queued or being processed, or the browser is gone."""
+        # The idle dispatcher holds a controller slot, so its active count never drops to zero
+        while not self.download_queue.wait_idle(timeout=2):
+            if self.supervisor:
+                if self.supervisor.closed.is_set():
+                    return
+                continue
+            try:
+                with self.driver_lock:
+                    self.driver.current_url  # Check if browser still open
+            except Exception:
+                return
+
     def add_download_buttons(self):
         """Add download buttons to each video in the favorites list"""
-        print("Waiting for videos to load...")
         try:
             WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'div[class*="DivContainer-StyledDivContainerV2"]'))
+                EC.presence_of_element_located((By.CSS_SELECTOR, FAVORITE_TILE_SELECTOR))
             )
         except Exception as e:
-            print(f"Error waiting for videos: {str(e)}")
+            log.error("favorites_load_error", f"Error waiting for videos: {str(e)}")
             return
 
         # Inject CSS for download buttons
@@ -279,12 +587,12 @@ class TikTokScraper:
             if (btn && !btn.classList.contains('downloaded')) {
                 const videoUrl = btn.getAttribute('data-video-url');
                 if (videoUrl) {
-                    btn.textContent = 'Opening...';
-                    // Open in new tab and signal to Python
-                    window.open(videoUrl, '_blank');
-                    window.lastOpenedUrl = videoUrl;
+                    // Queue for Python, which opens the tab at a paced rate
+                    window.pendingDownloads = window.pendingDownloads || [];
+                    const tileIndex = parseInt(btn.getAttribute('data-video-index'), 10);
+                    window.pendingDownloads.push({url: videoUrl, index: isNaN(tileIndex) ? null : tileIndex});
                     btn.classList.add('downloaded');
-                    btn.textContent = 'Downloaded';
+                    btn.textContent = 'Queued';
                 }
             }
         };
@@ -299,6 +607,9 @@ class TikTokScraper:
             }
         });
 
+        // URLs already queued before the page was (re)loaded; the sync adds to it
+        window.queuedUrls = new Set(arguments[0] || []);
+
         function addDownloadButtons() {
             console.log('Looking for video containers...');
             const videos = document.querySelectorAll('div[class*="DivContainer-StyledDivContainerV2"]');
@@ -317,6 +628,10 @@ class TikTokScraper:
                     if (videoLink) {
                         console.log('Found video link: ' + videoLink.href);
                         btn.setAttribute('data-video-url', videoLink.href);
+                        if (window.queuedUrls.has(videoLink.href)) {
+                            btn.classList.add('downloaded');
+                            btn.textContent = 'Queued';
+                        }
                     }
                     
                     video.style.position = 'relative';
@@ -359,192 +674,322 @@ class TikTokScraper:
         
         console.log('Download button setup complete');
         """
-        print("Adding download buttons to videos...")
-        self.driver.execute_script(js)
+        self.driver.execute_script(js, list(self.seen_urls))
+        log.debug("download_buttons_added")
+        self.capture_favorites()
+
+    def capture_page(self, kind, url, expected, html=None):
+        """Save the current page to the fixture archive if capture is enabled."""
+        if not self.fixture_recorder:
+            return
+        try:
+            self.fixture_recorder.capture(kind, url, html or self.driver.page_source, expected)
+        except Exception as e:
+            log.warning("fixture_error", f"Error capturing page fixture: {str(e)}", url=url)
+
+    def capture_favorites(self):
+        """Save the favorites page with the tile links the browser sees."""
+        if not self.fixture_recorder:
+            return
+        try:
+            links = self.driver.execute_script(
+                "return Array.from(document.querySelectorAll(arguments[0]))"
+                ".map(t => t.querySelector('a')?.getAttribute('href')).filter(Boolean);",
+                FAVORITE_TILE_SELECTOR,
+            )
+            self.capture_page("favorites", self.driver.current_url, {"links": links})
+        except Exception as e:
+            log.warning("fixture_error", f"Error capturing favorites fixture: {str(e)}")
         
     def setup_download_handler(self):
-        """Start background thread to handle downloads"""
-        def check_for_downloads():
+        """Start background threads to handle downloads"""
+        def poll_for_downloads():
             while True:
                 try:
-                    # Check if there's a new URL to process
-                    url = self.driver.execute_script("const url = window.lastOpenedUrl; window.lastOpenedUrl = null; return url;")
-                    if url:
-                        print("\n" + "="*50)
-                        print("DOWNLOAD PROCESS STARTED")
-                        print("="*50)
-                        print(f"Processing URL: {url}")
-                        
-                        # Extract video ID from URL
-                        video_id = url.split('/')[-1].split('?')[0]
-                        print(f"Video ID: {video_id}")
-                        
-                        # Extract uploader from URL
-                        try:
-                            uploader = url.split('/@')[1].split('/')[0]
-                            print(f"Extracted uploader: {uploader}")
-                        except Exception as e:
-                            print(f"Error extracting uploader: {str(e)}")
-                            uploader = None
-                        
-                        try:
-                            # Switch to the new tab
-                            self.driver.switch_to.window(self.driver.window_handles[-1])
-                            time.sleep(3)  # Wait for page load
-                             
-                            # Get video description if available
-                            print("Attempting to get video description...")
-                            try:
-                                desc_span = self.driver.find_element(By.CSS_SELECTOR, "span.css-j2a19r-SpanText")
-                                description = desc_span.text.strip()
-                                print(f"Description found: {description[:50]}...")
-                            except:
-                                print("No description found")
-                                description = None
-                                 
-                            # Set up file monitoring before starting download
-                            download_handler = DownloadHandler(self.airtable_manager, video_id, source_url=url)
-                            observer = Observer()
-                            observer.schedule(download_handler, self.download_dir, recursive=False)
-                            observer.start()
-                             
-                            try:
-                                # Wait for video element to be present
-                                print("Waiting for video element...")
-                                video = WebDriverWait(self.driver, 10).until(
-                                    EC.presence_of_element_located((By.TAG_NAME, "video"))
-                                )
-                                print("Video element found!")
-                                 
-                                # Create ActionChains instance
-                                actions = ActionChains(self.driver)
-                                 
-                                # Right click on the video element
-                                print("Right clicking video...")
-                                actions.context_click(video).perform()
-                                time.sleep(1)  # Wait for context menu
-                                 
-                                # Click the Download video option
-                                print("Looking for Download option...")
-                                menu_items = WebDriverWait(self.driver, 5).until(
-                                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, "span.css-108oj9l-SpanItemText"))
-                                )
-                                 
-                                # Find the Download video option
-                                download_option = None
-                                for item in menu_items:
-                                    if item.text.strip().lower() == "download video":
-                                        download_option = item
-                                        break
-                                        
-                                if download_option:
-                                    print("Found Download option, clicking...")
-                                    download_option.click()
-                                    
-                                    # Wait for download to complete
-                                    print("\nWaiting for download to complete...")
-                                    timeout = 30
-                                    try:
-                                        while timeout > 0 and not download_handler.found_file:
-                                            print(f"Waiting... {timeout} seconds left")  # Debug print
-                                            time.sleep(1)
-                                            timeout -= 1
-                                            
-                                        if download_handler.found_file:
-                                            print(f"Download completed: {download_handler.found_file}")
-                                            print("Creating Airtable record...")  # Debug print
-                                            try:
-                                                print("Calling create_record...")  # Debug print
-                                                record = self.airtable_manager.create_record(
-                                                    video_id=video_id,
-                                                    description=description,
-                                                    uploader=uploader,
-                                                    video_file=download_handler.found_file,
-                                                    source_url=url
-                                                )
-                                                print(f"Create record returned: {record}")  # Debug print
-                                                if not record:
-                                                    raise Exception("create_record returned None")
-                                            except Exception as e:
-                                                print(f"Error creating Airtable record: {str(e)}")
-                                                print(f"Full error details: {repr(e)}")
-                                                raise
-                                        else:
-                                            print("Download timed out")
-                                            self.airtable_manager.create_record(
-                                                video_id=video_id,
-                                                status="Failed - Download timeout"
-                                            )
-                                    except Exception as e:
-                                        print(f"Error during download wait: {str(e)}")
-                                        raise
-                                    finally:
-                                        print("Stopping observer...")  # Debug print
-                                        observer.stop()
-                                        observer.join()
-                                        print("Closing tab...")  # Debug print
-                                        
-                                        # Get current window handle
-                                        current_handle = self.driver.current_window_handle
-                                        
-                                        # Switch to favorites window first
-                                        print("Switching to favorites window...")  # Debug print
-                                        self.driver.switch_to.window(self.favorites_window)
-                                        
-                                        # Then close the download tab
-                                        self.driver.switch_to.window(current_handle)
-                                        self.driver.close()
-                                        
-                                        # Switch back to favorites window
-                                        self.driver.switch_to.window(self.favorites_window)
-                                        print("Download process complete")  # Debug print
-                                else:
-                                    print("Download option not found in context menu")
-                                    # Get current window handle and close it
-                                    current_handle = self.driver.current_window_handle
-                                    
-                                    # Switch to favorites window first
-                                    print("Switching to favorites window...")
-                                    self.driver.switch_to.window(self.favorites_window)
-                                    
-                                    # Then close the current tab
-                                    print("Closing tab since no download option found...")
-                                    self.driver.switch_to.window(current_handle)
-                                    self.driver.close()
-                                    
-                                    # Switch back to favorites window
-                                    self.driver.switch_to.window(self.favorites_window)
-                                    print("Returned to favorites")
-                                    
-                                    raise Exception("Download video option not found")
-                                    
-                            except Exception as e:
-                                print(f"\nError during download: {str(e)}")
-                                self.airtable_manager.create_record(
-                                    video_id=video_id,
-                                    status=f"Failed - {str(e)}"
-                                )
-                                 
-                            finally:
-                                observer.stop()
-                                observer.join()
-                                 
-                        except Exception as e:
-                            print(f"\nError setting up download: {str(e)}")
-                            self.airtable_manager.create_record(
-                                video_id=video_id,
-                                status=f"Failed - {str(e)}"
-                            )
-                             
+                    # Drain the queue of URLs clicked on the favorites page
+                    with self.driver_lock:
+                        self.read_favorite_durations()
+                        urls = self.driver.execute_script(
+                            "const q = window.pendingDownloads || []; window.pendingDownloads = []; return q;"
+                        )
+                    for entry in urls or []:
+                        url = entry.get("url") if isinstance(entry, dict) else entry
+                        tile_index = entry.get("index") if isinstance(entry, dict) else None
+                        self.seen_urls.add(url)
+                        log.debug("video_queued", f"Queued {url}", video_id=parse_video_url(url)[0], url=url,
+                                  tile_index=tile_index)
+                        self.download_queue.put(url, tile_index=tile_index)
                     time.sleep(1)  # Check every second
-                    
+
                 except Exception as e:
-                    print(f"Error in download handler: {str(e)}")
+                    if self.supervisor:
+                        # The supervisor decides whether the browser is gone or being restarted
+                        if self.supervisor.closed.is_set():
+                            break
+                        time.sleep(1)
+                        continue
+                    log.error("poll_error", f"Error in download handler: {str(e)}")
                     try:
                         self.driver.current_url  # Check if browser still open
                     except:
                         break
-                        
-        # Start the background thread
-        self.download_thread = threading.Thread(target=check_for_downloads, daemon=True)
+
+        def dispatch_downloads():
+            while True:
+                # Wait for a free worker first so the scheduler picks as late as possible
+                self.controller.acquire_slot()
+                url = self.download_queue.get()
+                worker = threading.Thread(target=self.process_download, args=(url,), daemon=True)
+                worker.start()
+
+        # Start the background threads
+        self.download_thread = threading.Thread(target=poll_for_downloads, daemon=True)
         self.download_thread.start()
+        self.dispatch_thread = threading.Thread(target=dispatch_downloads, daemon=True)
+        self.dispatch_thread.start()
+
+    def process_download(self, url):
+        """Download, upload and record a single queued video. Runs on a worker thread."""
+        # Extract video ID and uploader from URL
+        video_id, uploader = parse_video_url(url)
+        vlog = log.bind(video_id=video_id)
+        vlog.debug("video_started", url=url, uploader=uploader)
+        # Read before touching the driver so a restart that kills it mid-download is noticed
+        self.driver_ready.wait()
+        generation = self.generation
+
+        try:
+            # A retry can often skip the page: reuse the file or the cached media URL
+            cached = self.download_from_cache(video_id)
+            if cached:
+                description, uploader, found_file = cached[0], cached[1] or uploader, cached[2]
+            else:
+                # The browser stage is serialized; only the upload/record stage runs in parallel
+                with self.driver_lock:
+                    description, found_file, page_load, bytes_per_second = self.download_in_browser(url, video_id)
+                vlog.debug("download_completed", file=found_file, page_load=page_load,
+                           bytes_per_second=bytes_per_second)
+            record = self.airtable_manager.create_record(
+                video_id=video_id,
+                description=description,
+                uploader=uploader,
+                video_file=found_file,
+                source_url=url
+            )
+            if not record:
+                raise Exception("create_record returned None")
+
+            if not cached:
+                self.controller.record_success(page_load, bytes_per_second)
+            queue_seconds = self.download_queue.complete(url, archived=True)
+            vlog.info("video_archived", f"Archived {os.path.basename(found_file)}", file=found_file,
+                      policy=self.download_queue.policy,
+                      queue_seconds=round(queue_seconds, 1) if queue_seconds is not None else None)
+
+        except Exception as e:
+            restarted = self.generation != generation
+            if restarted and url not in self.restart_requeues:
+                # The browser was restarted under us; try once more on the new driver, like batch mode
+                self.restart_requeues.add(url)
+                vlog.info("video_requeued", "Requeued after browser restart", url=url)
+                self.download_queue.requeue(url)
+                return
+            reason = getattr(e, "reason", "error")
+            self.download_queue.complete(url, archived=False)
+            vlog.warning("video_failed", f"Error during download: {str(e)}", reason=reason)
+            if not restarted:
+                self.controller.record_failure(reason)
+            self.airtable_manager.create_record(
+                video_id=video_id,
+                description=None,
+                uploader=uploader,
+                status=f"Failed - {str(e)}"
+            )
+
+        finally:
+            self.controller.release_slot()
+            profiling.video_done()
+
+    def read_page_metadata(self, url, video_id, description, uploader):
+        """Read the open video page once to save a fixture, cache its metadata and prefetch its cover.
+
+        Caller must hold driver_lock. Returns the media info dict (empty if
+        none of those are enabled).
+        """
+        thumbnails = self.airtable_manager.thumbnails
+        if not self.fixture_recorder and not self.metadata_cache and not thumbnails:
+            return {}
+        try:
+            html = self.driver.page_source
+        except Exception as e:
+            log.debug("page_source_error", video_id=video_id, error=str(e))
+            return {}
+        self.capture_page("video", url, {
+            "video_id": video_id,
+            "description": description,
+            "uploader": uploader,
+        }, html=html)
+        info = extract_media_info(html)
+        if thumbnails:
+            # Fetched while the video downloads; create_record attaches it
+            thumbnails.prefetch(video_id, info["cover_url"])
+        if self.metadata_cache:
+            self.metadata_cache.put(video_id, description=description, uploader=uploader, source_url=url, **info)
+        return info
+
+    def download_from_cache(self, video_id):
+        """Return (description, uploader, file) without opening the video page, or None.
+
+        Reuses the file from an earlier attempt if it is still on disk, else
+        fetches the cached media URL directly while it has not expired.
+        """
+        if not self.metadata_cache or not video_id:
+            return None
+        metadata = self.metadata_cache.get(video_id)
+        if not metadata:
+            return None
+        vlog = log.bind(video_id=video_id)
+        video_file = metadata.get("video_file")
+        if not (video_file and os.path.exists(video_file)):
+            if not self.metadata_cache.media_url_valid(metadata):
+                vlog.debug("cache_stale", has_media_url=bool(metadata.get("media_url")))
+                return None
+            try:
+                video_file = self.fetch_media(video_id, metadata["media_url"])
+            except Exception as e:
+                vlog.info("cache_fetch_failed", f"Cached media URL failed, reopening the page: {str(e)}")
+                self.metadata_cache.forget(video_id)
+                return None
+            self.metadata_cache.put(video_id, video_file=video_file)
+        if self.airtable_manager.thumbnails:
+            self.airtable_manager.thumbnails.prefetch(video_id, metadata.get("cover_url"))
+        vlog.info("cache_hit", f"Reused cached page metadata for {video_id}", file=video_file)
+        return metadata.get("description"), metadata.get("uploader"), video_file
+
+    def fetch_media(self, video_id, media_url):
+        """Download a media URL straight into the download directory with the browser's cookies."""
+        target = os.path.join(self.download_dir, f"{video_id}.mp4")
+        partial = target + ".part"
+        # Hold the browser stage so no download handler mistakes this file for its own
+        with self.driver_lock:
+            cookies = {cookie["name"]: cookie["value"] for cookie in self.driver.get_cookies()}
+            user_agent = self.driver.execute_script("return navigator.userAgent")
+            self.wait_for_bandwidth()
+            start_time = time.time()
+            try:
+                with self.http.get(media_url, cookies=cookies, stream=True, timeout=30,
+                                   headers={"User-Agent": user_agent, "Referer": "https://www.tiktok.com/"}) as response:
+                    response.raise_for_status()
+                    if not response.headers.get("Content-Type", "").startswith("video/"):
+                        raise Exception(f"Unexpected content type {response.headers.get('Content-Type')}")
+                    with open(partial, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=256 * 1024):
+                            f.write(chunk)
+                os.replace(partial, target)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+            self.record_download_bytes(target, start_time)
+        return target
+
+    def wait_for_bandwidth(self):
+        """Block until the download limiter allows another download to start."""
+        if self.download_limiter:
+            self.download_limiter.wait()
+
+    def apply_download_throttle(self):
+        """Cap the current tab's download rate at the scheduled limit. Caller must hold driver_lock."""
+        if not self.download_limiter:
+            return
+        rate = self.download_limiter.current_rate()
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.emulateNetworkConditions", {
+                "offline": False,
+                "latency": 0,
+                "downloadThroughput": rate or -1,
+                "uploadThroughput": -1,
+            })
+        except Exception as e:
+            log.debug("throttle_error", error=str(e))
+
+    def record_download_bytes(self, file_path, started):
+        """Charge a finished download to the download limiter."""
+        if not self.download_limiter or not file_path:
+            return
+        try:
+            self.download_limiter.record(os.path.getsize(file_path), started)
+        except OSError:
+            pass
+
+    @profiled("download_in_browser")
+    def download_in_browser(self, url, video_id, timeout=30):
+        """Open the video in a new tab and download it via the context menu.
+
+        Caller must hold driver_lock. Returns (description, file, page_load_seconds,
+        bytes_per_second) or raises DownloadFailure.
+        """
+        vlog = log.bind(video_id=video_id)
+        self.controller.wait_for_navigation()
+        self.wait_for_bandwidth()
+
+        download_handler = DownloadHandler(self.airtable_manager, video_id, source_url=url)
+        observer = Observer()
+        observer.schedule(download_handler, self.download_dir, recursive=False)
+        observer.start()
+
+        self.driver.switch_to.new_window('tab')
+        try:
+            self.apply_download_throttle()
+            # Navigate and time until the video element is present
+            start_time = time.time()
+            self.driver.get(url)
+            try:
+                video = WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "video"))
+                )
+            except TimeoutException:
+                if self.driver.find_elements(By.CSS_SELECTOR, "[id*='captcha'], [class*='captcha']"):
+                    raise DownloadFailure("captcha", "CAPTCHA shown instead of video")
+                raise DownloadFailure("page_load_timeout", "Video element did not load")
+            page_load = time.time() - start_time
+            vlog.debug("page_loaded", page_load=round(page_load, 2))
+
+            # Get video description if available
+            try:
+                desc_span = self.driver.find_element(By.CSS_SELECTOR, DESCRIPTION_SELECTOR)
+                description = desc_span.text.strip()
+            except:
+                vlog.debug("description_missing", url=url)
+                description = None
+            self.read_page_metadata(url, video_id, description, parse_video_url(url)[1])
+
+            if not self.click_context_menu_download(video):
+                raise DownloadFailure("download_option_missing", "Download video option not found")
+            click_time = time.time()
+
+            # Wait for download to complete; the handler wakes us as soon as the file lands
+            if not download_handler.found_event.wait(timeout):
+                raise DownloadFailure("download_timeout", "Download timeout")
+
+            elapsed = max(time.time() - click_time, 0.001)
+            self.record_download_bytes(download_handler.found_file, click_time)
+            if self.metadata_cache:
+                self.metadata_cache.put(video_id, video_file=download_handler.found_file)
+            try:
+                bytes_per_second = os.path.getsize(download_handler.found_file) / elapsed
+            except OSError:
+                bytes_per_second = None
+
+            return description, download_handler.found_file, page_load, bytes_per_second
+
+        finally:
+            observer.stop()
+            observer.join()
+            # Close the video tab and return to favorites
+            try:
+                self.driver.close()
+            except Exception as e:
+                vlog.warning("tab_close_error", f"Error closing tab: {str(e)}")
+            if self.favorites_window:
+                self.driver.switch_to.window(self.favorites_window)